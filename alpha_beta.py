@@ -1,76 +1,423 @@
-from copy import deepcopy
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Tuple, Union
 import logging
+import math
+import threading
+import time
 import numpy as np
+from analysis_cache import AnalysisCache
+from bitboard import xy2sq, sq2xy, get_moves, get_flips
 from board import Board
-from constant import BOARD_SIZE
+from constant import EMPTY, MAX_SEARCH_DEPTH, ENDGAME_EMPTIES, ENDGAME_TIME_RATIO, ENDGAME_MAX_NODES, SEARCH_WORKERS, EVALUATOR, ANALYSIS_CACHE_PATH, ANALYSIS_CACHE_MIN_DEPTH
+from evaluation import PositionalEvaluator, get_evaluator
+from endgame import EndgameSolver, solve_board, EndgameTimeout, WLD, EXACT_DISCS
+from move_ordering import MoveOrdering
+from opening_book import OpeningBook, load_opening_book
+from search_stats import SearchStats
+from symmetry import canonicalize, SQUARE_MAP, INVERSE_SQUARE_MAP
+from transposition import TranspositionTable, load_transposition_table, zobrist_hash, EXACT, LOWER_BOUND, UPPER_BOUND, NO_MOVE
 
 
 # ログの設定
 format = "%(asctime)s: %(levelname)s: %(pathname)s: line %(lineno)s: %(message)s"
 logging.basicConfig(filename='/var/log/intern3/flask.log', level=logging.DEBUG, format=format, datefmt='%Y-%m-%d %H:%M:%S')
 
+INF = 10000 # 評価値の上限
+WIN_SCORE = 5000 # 終局したときの評価値(これに石の差を足す)
+PASS = None # 読み筋の中のパス
 
-def alpha_beta(board: Board, x: int, y: int, color: int, first_color: int, depth: int, alpha, beta) -> int:
-    copy_board = deepcopy(board)
-    copy_board.init_movable()
-    copy_board.put_disc(x, y) # ここでcopy_board.current_colorが反転
-
-    if depth <= 0:
-        board_point = np.array([
-            [-120, -120, -120, -120, -120, -120, -120, -120, -120, -120],
-            [-120,  120,  -20,   20,    5,    5,   20,  -20,  120, -120],
-            [-120,  -20,  -40,   -5,   -5,   -5,   -5,  -40,  -20, -120],
-            [-120,   20,   -5,   15,    3,    3,   15,   -5,   20, -120],
-            [-120,    5,   -5,    3,    3,    3,    3,   -5,    5, -120],
-            [-120,    5,   -5,    3,    3,    3,    3,   -5,    5, -120],
-            [-120,   20,   -5,   15,    3,    3,   15,   -5,   20, -120],
-            [-120,  -20,  -40,   -5,   -5,   -5,   -5,  -40,  -20, -120],
-            [-120,  120,  -20,   20,    5,    5,   20,  -20,  120, -120],
-            [-120, -120, -120, -120, -120, -120, -120, -120, -120, -120]
-        ], dtype=np.int8)
-        score = (board_point * (copy_board.board == first_color)).sum() - (board_point * (copy_board.board == -first_color)).sum()
-        #print(score)
-        return score
+# 制限時間を過ぎたときに探索を打ち切るための例外
+class SearchTimeout(Exception):
+    pass
 
-    else:
-        copy_board.init_movable()
-        if depth >= 2:
-            logging.debug(f'探索する数：{np.count_nonzero(copy_board.movable_pos > 0)}')
-        for i in range(1, BOARD_SIZE + 1):
-            for j in range(1, BOARD_SIZE + 1):
-                if copy_board.movable_pos[i, j] > 0:
-                    score = alpha_beta(copy_board, i, j, copy_board.current_color, first_color, depth - 1, alpha, beta)
-                    #print(score)
-                    if color == first_color and score > alpha:
-                        alpha = score
-                    elif color == -first_color and score < beta:
-                        beta = score
-                    #print(f'color:{color:2} node:{depth:1} α:{alpha:5} β:{beta:5}')
+
+# ワーカーの中でリクエストをまたいで使い回す置換表と手の並べ替えの情報
+# 置換表はgunicornのマスターが共有メモリに作っていれば、それをワーカー間で共有する(guniconf.py)
+transposition_table = load_transposition_table()
+move_ordering = MoveOrdering()
+
+# 定石の本(ファイルがなければNone)
+opening_book = load_opening_book()
+
+# 解析キャッシュ(ファイルは最初に使うときに開く)
+analysis_cache = AnalysisCache() if ANALYSIS_CACHE_PATH is not None else None
+
+# ルートの手を並列に探索するためのプロセスプール(最初に使うときに作る)
+executor = None
+executor_workers = 0
+
+
+# 置換表のキー(対称な局面をまとめた盤面と手番)と、標準形にするための変換の番号
+# 置換表の最善手は標準形の向きのマス番号で保存する
+def position_key(board: Board) -> Tuple[int, int]:
+    black, white = board.to_bits()
+    black, white, sym = canonicalize(black, white)
+    return zobrist_hash(black, white, board.current_color), sym
+
+
+# 終局した盤面の手番側から見た評価値(勝ちなら石の差に関わらず途中の評価値より大きくする)
+def final_score(board: Board) -> int:
+    return final_score_bits(*board.players(board.current_color))
+
+
+def final_score_bits(player: int, opponent: int) -> int:
+    diff = player.bit_count() - opponent.bit_count()
+    if diff > 0:
+        return WIN_SCORE + diff
+    elif diff < 0:
+        return -WIN_SCORE + diff
+    return 0
+
+
+# 手番側から見た評価値を返すネガマックス法の主変化探索(PVS)
+# 1手目以外はnull window(幅0の窓)で探索し、αを超えたときだけ窓を広げて再探索する
+class Search:
+    def __init__(self, tt: Union[TranspositionTable, None] = None, ordering: Union[MoveOrdering, None] = None, deadline: Union[float, None] = None, evaluator: Union[PositionalEvaluator, None] = None, stop: Union[threading.Event, None] = None) -> None:
+        self.tt = tt
+        self.ordering = ordering
+        self.deadline = deadline
+        self.stop = stop # 別のスレッドからsetされたら時間切れと同じように打ち切る
+        self.max_nodes = None # 探索する局面数の上限(超えたら時間切れと同じように打ち切る)
+        self.evaluator = evaluator if evaluator is not None else get_evaluator()
+        self.nodes = 0
+        self.leaves = 0
+
+    # boardを根として探索する
+    def search(self, board: Board, depth: int, alpha: int = -INF, beta: int = INF, ply: int = 0) -> Tuple[int, List[Union[Tuple[int, int], None]]]:
+        self.evaluator.reset(board)
+        return self.pvs(board, depth, alpha, beta, ply)
+
+    # (評価値, 読み筋)を返す。評価値は窓の外でもそのまま返す(fail-soft)
+    def pvs(self, board: Board, depth: int, alpha: int, beta: int, ply: int = 0) -> Tuple[int, List[Union[Tuple[int, int], None]]]:
+        if self.deadline is not None and time.perf_counter() > self.deadline:
+            raise SearchTimeout()
+        if self.stop is not None and self.stop.is_set():
+            raise SearchTimeout()
+        if self.max_nodes is not None and self.nodes >= self.max_nodes:
+            raise SearchTimeout()
+        self.nodes += 1
+
+        if board.is_end():
+            self.leaves += 1
+            return final_score(board), []
+        if depth <= 0:
+            self.leaves += 1
+            return self.evaluator.evaluate(board), []
+
+        moves = board.legal_moves()
+        if not moves:
+            # 打てる手がないので手番だけ相手に渡す(深さは減らさない)
+            board.make_pass()
+            score, pv = self.pvs(board, depth, -beta, -alpha, ply + 1)
+            board.undo_move()
+            return -score, [PASS] + pv
+
+        tt_move = NO_MOVE
+        if self.tt is not None:
+            key, sym = position_key(board)
+            entry = self.tt.probe(key)
+            if entry is not None:
+                tt_depth, tt_flag, tt_score, tt_move = entry
+                if tt_move != NO_MOVE:
+                    tt_move = INVERSE_SQUARE_MAP[sym][tt_move]
+                # ルートでは読み筋を得るために必ず探索する
+                if ply > 0 and tt_depth >= depth and (tt_flag == EXACT or (tt_flag == LOWER_BOUND and tt_score >= beta) or (tt_flag == UPPER_BOUND and tt_score <= alpha)):
+                    return tt_score, [sq2xy(tt_move)] if tt_move != NO_MOVE else []
+
+        if self.ordering is not None:
+            moves = self.ordering.order(board, moves, ply, tt_move)
+        else:
+            # 置換表に最善手があればそれから調べる
+            for k, (x, y) in enumerate(moves):
+                if xy2sq(x, y) == tt_move:
+                    moves.insert(0, moves.pop(k))
+                    break
+
+        alpha_init = alpha
+        best_score = -INF
+        best_pv = []
+        # 残り1手なら子の局面を打たずにまとめて評価しておく
+        leaf_scores = self.leaf_scores(board, moves) if depth == 1 else None
+        for k, (x, y) in enumerate(moves):
+            if leaf_scores is not None:
+                score, pv = leaf_scores[k], []
+            else:
+                board.make_move(x, y)
+                self.evaluator.make_move(board)
+                if k == 0:
+                    score, pv = self.pvs(board, depth - 1, -beta, -alpha, ply + 1)
+                    score = -score
+                else:
+                    score, pv = self.pvs(board, depth - 1, -alpha - 1, -alpha, ply + 1)
+                    score = -score
+                    if alpha < score < beta:
+                        score, pv = self.pvs(board, depth - 1, -beta, -score, ply + 1)
+                        score = -score
+                self.evaluator.undo_move()
+                board.undo_move()
+
+            if score > best_score:
+                best_score = score
+                best_pv = [(x, y)] + pv
+                if score > alpha:
+                    alpha = score
                     if alpha >= beta:
-                        #print(f'{alpha} >= {beta}')
-                        return alpha if color == first_color else beta
-        #print(f'color:{color} node:{depth} α:{alpha} β:{beta}')
-        return alpha if color == first_color else beta
-
-
-def act_alpha_beta(board: Board) -> None:
-    INIT_VALUE = 10000
-    best_score = -INIT_VALUE
-    best_pos = (-1, -1)
-    searchable_num = np.count_nonzero(board.movable_pos > 0)
-    logging.debug(f'探索する数：{np.count_nonzero(board.movable_pos > 0)}')
-    for x in range(1, BOARD_SIZE + 1):
-        for y in range(1, BOARD_SIZE + 1):
-            if board.movable_pos[x, y] > 0:
-                score = alpha_beta(board, x, y, board.current_color, board.current_color, min(searchable_num - 1, 3), -INIT_VALUE, INIT_VALUE)
-                if score > best_score:
-                    best_score = score
-                    best_pos = (x, y)
-    board.put_disc(*best_pos) # 決定した座標に実際に置く
+                        if self.ordering is not None:
+                            self.ordering.update((x, y), ply, depth, k)
+                        break
+
+        if self.tt is not None:
+            if best_score <= alpha_init:
+                flag = UPPER_BOUND
+            elif best_score >= beta:
+                flag = LOWER_BOUND
+            else:
+                flag = EXACT
+            self.tt.store(key, depth, flag, best_score, SQUARE_MAP[sym][xy2sq(*best_pv[0])])
+        return best_score, best_pv
+
+    # 手番側がmovesのそれぞれに打った局面の評価値(手番側から見た値)をまとめて求める
+    # 盤面には打たず、ビット列の上で子の局面を作る
+    def leaf_scores(self, board: Board, moves: List[Tuple[int, int]]) -> list:
+        self.nodes += len(moves)
+        self.leaves += len(moves)
+        player, opponent = board.players(board.current_color)
+        scores = [0] * len(moves)
+        indices = []
+        children = []
+        for k, (x, y) in enumerate(moves):
+            sq = xy2sq(x, y)
+            flips = get_flips(player, opponent, sq)
+            next_player = opponent ^ flips
+            next_opponent = player | flips | (1 << sq)
+            if not get_moves(next_player, next_opponent) and not get_moves(next_opponent, next_player):
+                scores[k] = -final_score_bits(next_player, next_opponent)
+            else:
+                indices.append(k)
+                children.append((next_player, next_opponent))
+        if children:
+            for k, score in zip(indices, self.evaluator.evaluate_children(board, children)):
+                scores[k] = -score
+        return scores
+
+
+def get_executor(workers: int) -> ProcessPoolExecutor:
+    global executor, executor_workers
+    if executor is None or executor_workers != workers:
+        if executor is not None:
+            executor.shutdown()
+        executor = ProcessPoolExecutor(max_workers=workers)
+        executor_workers = workers
+    return executor
+
+
+# 子プロセスでルートの1手を打った局面を全幅の窓で探索する(時間切れならNone)
+# 子プロセスの置換表はforkしたときの写しで直列の探索とは中身が違うので、置換表は使わない
+def search_child(job: tuple) -> Union[Tuple[int, list, int, int], None]:
+    board_class, turn, color, data, move, depth, wall_deadline, use_ordering, evaluator_name = job
+    board = board_class(turn, color, data)
+    board.make_move(*move)
+    # 時刻はプロセスをまたいで比べられるtime.time()で受け取る
+    deadline = None if wall_deadline is None else time.perf_counter() + (wall_deadline - time.time())
+    search = Search(None, move_ordering if use_ordering else None, deadline, get_evaluator(evaluator_name))
+    try:
+        score, pv = search.search(board, depth, -INF, INF, 1)
+    except SearchTimeout:
+        return None
+    return -score, [move] + pv, search.nodes, search.leaves
+
+
+# ルートの手をプロセスに分けて探索し、(評価値, 読み筋, ノード数, 末端の局面数)を返す
+# どの手も置換表を使わずに全幅の窓で評価値を求めてから、直列の探索と同じ並び順で最初に最大になった手を選ぶ
+# 手の並べ替えは評価値を変えないので、同じ深さなら置換表を使わない直列の探索(Search(None, ordering))と同じ手・同じ評価値になる
+def search_root_parallel(board: Board, depth: int, workers: int, deadline: Union[float, None] = None, ordering: Union[MoveOrdering, None] = None, evaluator_name: str = EVALUATOR) -> Tuple[int, list, int, int]:
+    moves = board.legal_moves()
+    if ordering is not None:
+        moves = ordering.order(board, moves, 0)
+
+    wall_deadline = None if deadline is None else time.time() + (deadline - time.perf_counter())
+    jobs = [(type(board), board.turn, board.current_color, board.to_bytes(), (int(x), int(y)), depth - 1, wall_deadline, ordering is not None, evaluator_name) for x, y in moves]
+    results = list(get_executor(workers).map(search_child, jobs))
+    if any(result is None for result in results):
+        raise SearchTimeout()
+
+    best_score, best_pv, nodes, leaves = -INF, [], 1, 0
+    for score, pv, child_nodes, child_leaves in results:
+        nodes += child_nodes
+        leaves += child_leaves
+        if score > best_score:
+            best_score, best_pv = score, pv
+    return best_score, best_pv, nodes, leaves
+
+
+# time_limit(秒)を指定すると反復深化で探索し、時間内に最後まで終わった深さの最善手を打つ
+# 指定しなければ従来どおり深さ固定で探索する
+# 空きマスがENDGAME_EMPTIES以下なら、時間のENDGAME_TIME_RATIOの割合を使って終局まで読み切る(勝敗 → 石の差の順)
+# 石の差まで読み切れなければ残りの時間で普通に探索し、勝ちか引き分けを読み切れていればその手を打つ
+# workersが2以上ならルートの手をその数のプロセスで並列に探索する(直列の探索と同じ手を選ぶように、置換表は使わない)
+# 定石の本に載っている局面なら探索せずに本の手を打つ
+# 解析キャッシュに深く探索した結果があればその手を打ち、深く探索できたら結果を解析キャッシュに書き込む
+# evaluatorを指定しなければconstant.EVALUATORの評価関数を新しく作って使う(評価関数は探索中の状態を持つので、先読みのスレッドと同じものを使わない)
+# 探索の統計(SearchStats)を返す(logがTrueならログにも書く)
+# stopがsetされたら探索を打ち切る(先読みで使う。打ち切ったときの手は信用できない)
+def act_alpha_beta(board: Board, time_limit: Union[float, None] = None, max_depth: int = MAX_SEARCH_DEPTH, tt: Union[TranspositionTable, None] = transposition_table, ordering: Union[MoveOrdering, None] = move_ordering, endgame_empties: int = ENDGAME_EMPTIES, workers: int = SEARCH_WORKERS, book: Union[OpeningBook, None] = opening_book, evaluator: Union[PositionalEvaluator, None] = None, stop: Union[threading.Event, None] = None, log: bool = True, cache: Union[AnalysisCache, None] = analysis_cache) -> SearchStats:
+    start = time.perf_counter()
+    stats = SearchStats()
+    # numpyの整数のままだと深さや統計に入ってJSONにできないので、intにしておく
+    searchable_num = int(np.count_nonzero(board.movable_pos > 0))
+    empty_num = int(np.count_nonzero(board.board == EMPTY))
+    stats.moves = searchable_num
+    stats.empties = empty_num
+    if book is not None:
+        entry = book.lookup(board)
+        if entry is not None and board.movable_pos[entry[0]]:
+            stats.book = True
+            stats.move, stats.score, stats.depth = entry[0], entry[1], entry[2]
+            stats.pv = [entry[0]]
+            stats.elapsed = time.perf_counter() - start
+            if log:
+                stats.log()
+            board.put_disc(*entry[0])
+            return stats
+    if evaluator is None:
+        evaluator = get_evaluator()
+    if cache is not None:
+        entry = cache.lookup(board, evaluator.name)
+        if entry is not None and entry[2] >= ANALYSIS_CACHE_MIN_DEPTH and board.movable_pos[entry[0]]:
+            stats.cache = True
+            stats.move, stats.score, stats.depth = entry[0], entry[1], entry[2]
+            stats.pv = [entry[0]]
+            stats.evaluator = evaluator.name
+            stats.elapsed = time.perf_counter() - start
+            if log:
+                stats.log()
+            board.put_disc(*entry[0])
+            return stats
+    if tt is not None:
+        tt.new_search()
+    if ordering is not None:
+        ordering.new_search()
+
+    deadline = None if time_limit is None else start + time_limit
+    endgame_result = None # 読み切れた(石の差, 手)
+    if empty_num <= endgame_empties:
+        # 時間を決めないとき(Noneか無限大)は局面数で打ち切る
+        timed = time_limit is not None and math.isfinite(time_limit)
+        endgame_deadline = start + time_limit * ENDGAME_TIME_RATIO if timed else None
+        solver = EndgameSolver(endgame_deadline, stop, None if timed else ENDGAME_MAX_NODES)
+        for mode in (WLD, EXACT_DISCS):
+            try:
+                disc_diff, best_pos = solve_board(board, mode, solver=solver)
+            except EndgameTimeout:
+                break
+            stats.endgame = 'exact' if mode == EXACT_DISCS else 'wld'
+            # WLDで負けのときの手は最善手ではないので使わない
+            if mode == EXACT_DISCS or disc_diff >= 0:
+                endgame_result = (disc_diff, best_pos)
+        stats.endgame_nodes = solver.nodes
+
+    if stats.endgame == 'exact':
+        depths = []
+    elif time_limit is None:
+        depths = [min(searchable_num, 4)]
+    else:
+        # 空きマスの数より深く読んでも意味がない
+        depths = range(1, min(max_depth, empty_num) + 1)
+
+    if workers > 1:
+        tt = None
+    search = Search(tt, ordering, evaluator=evaluator, stop=stop)
+    best_pv = [board.legal_moves()[0]]
+    best_score = 0
+    completed_depth = 0
+    base = len(board.undo_stack)
+    for depth in depths:
+        # 最初の深さは必ず最後まで探索して手を確保する
+        search.deadline = deadline if depth > 1 else None
+        try:
+            if workers > 1 and depth > 1:
+                best_score, best_pv, nodes, leaves = search_root_parallel(board, depth, workers, search.deadline, ordering, search.evaluator.name)
+                search.nodes += nodes
+                search.leaves += leaves
+            else:
+                best_score, best_pv = search.search(board, depth)
+        except SearchTimeout:
+            # 打ちかけの手を全部戻して、前の深さの結果を使う
+            while len(board.undo_stack) > base:
+                board.undo_move()
+            break
+        completed_depth = depth
+
+    if endgame_result is not None:
+        best_score, best_pv = endgame_result[0], [endgame_result[1]]
+
+    # 終局まで石の差を読み切れたら、空きマスの数の深さまで探索したものとして残す
+    cache_depth = empty_num if stats.endgame == 'exact' else completed_depth
+    if cache is not None and cache_depth >= ANALYSIS_CACHE_MIN_DEPTH and (stop is None or not stop.is_set()):
+        cache.store(board, evaluator.name, best_pv[0], best_score, cache_depth)
+
+    stats.move = best_pv[0]
+    stats.score = best_score
+    stats.pv = best_pv
+    stats.depth = completed_depth
+    stats.nodes = search.nodes + stats.endgame_nodes
+    stats.leaves = search.leaves
+    stats.elapsed = time.perf_counter() - start
+    if tt is not None:
+        stats.tt_probes, stats.tt_hits = tt.probes, tt.hits
+    if ordering is not None:
+        stats.cutoffs = ordering.cutoffs
+        stats.first_move_cutoff_rate = ordering.first_move_cutoff_rate()
+    stats.evaluator = search.evaluator.name
+    stats.workers = workers
+    if log:
+        stats.log()
+    board.put_disc(*best_pv[0]) # 決定した座標に実際に置く
+    return stats
+
+
+# 盤面を変えずに、手番側の良い手を上位k個まで(手, 評価値, 読み筋)のリストで返す(評価値の高い順)
+# 反復深化で時間(time_limit秒)か局面数(max_nodes)の上限まで読み、最後まで終わった深さの結果を使う
+# 上位k個に入らない手はk番目の評価値を下限とした窓で調べるので、全部の手を正確に読むより安い
+# 置換表と手の並べ替えの情報は対戦中の探索と共有する
+def analyze(board: Board, k: int = 3, time_limit: Union[float, None] = None, max_nodes: Union[int, None] = None, max_depth: int = MAX_SEARCH_DEPTH, tt: Union[TranspositionTable, None] = transposition_table, ordering: Union[MoveOrdering, None] = move_ordering, evaluator: Union[PositionalEvaluator, None] = None) -> Tuple[int, List[Tuple[Tuple[int, int], int, list]]]:
+    moves = board.legal_moves()
+    if not moves:
+        return 0, []
+    empty_num = int(np.count_nonzero(board.board == EMPTY))
+    search = Search(tt, ordering, evaluator=evaluator)
+    deadline = None if time_limit is None else time.perf_counter() + time_limit
+    base = len(board.undo_stack)
+    ranking = [(move, 0, [move]) for move in moves]
+    completed_depth = 0
+    for depth in range(1, min(max_depth, empty_num) + 1):
+        # 最初の深さは必ず最後まで探索する
+        search.deadline = deadline if depth > 1 else None
+        search.max_nodes = max_nodes if depth > 1 else None
+        results = []
+        try:
+            # 前の深さで良かった手から調べる
+            for move, _, _ in ranking:
+                top = sorted(score for _, score, _, _ in results)[-k:]
+                alpha = top[0] if len(top) >= k else -INF
+                board.make_move(*move)
+                score, pv = search.search(board, depth - 1, -INF, -alpha, 1)
+                board.undo_move()
+                # alpha以下なら上位に入らない(評価値は上限でしかないので、同じ値の正確な手より後ろに並べる)
+                results.append((move, -score, [move] + pv, -score > alpha))
+        except SearchTimeout:
+            while len(board.undo_stack) > base:
+                board.undo_move()
+            break
+        ranking = [result[:3] for result in sorted(results, key=lambda result: (result[1], result[3]), reverse=True)]
+        completed_depth = depth
+        if max_nodes is not None and search.nodes >= max_nodes:
+            break
+    return completed_depth, ranking[:k]
 
 
 if __name__ == '__main__':
     board = Board()
     board.put_max_pos()
-    best_pos = act_alpha_beta(board)
-    print(best_pos)
+    stats = act_alpha_beta(board)
+    print(stats.to_dict())
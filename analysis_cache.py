@@ -0,0 +1,109 @@
+# 局面の解析結果をファイルに残しておくキャッシュ
+# 深く探索できた局面の(最善手, 評価値, 深さ)をSQLiteに保存し、ワーカーが再起動しても次から探索せずに使う
+# 局面は対称なものをまとめた標準形(opening_book.book_keyと同じ)で持ち、最善手も標準形の向きで保存する
+# 探索や評価関数を変えたらENGINE_VERSIONを上げる(古い版の結果は開いたときに消す)
+# 件数が上限を超えたら、最後に使われたのが古いものから消す
+# 最後に使った時刻はANALYSIS_CACHE_TOUCH_INTERVALより古いときだけ書き直すので、読むだけならほとんど書き込まない(複数のワーカーで書き込みのロックを取り合わない)
+
+from typing import Tuple, Union
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from bitboard import xy2sq, sq2xy
+from board import Board
+from constant import ANALYSIS_CACHE_PATH, ANALYSIS_CACHE_SIZE, ANALYSIS_CACHE_TOUCH_INTERVAL, ENGINE_VERSION
+from opening_book import book_key
+from symmetry import SQUARE_MAP, INVERSE_SQUARE_MAP
+
+
+EVICT_RATIO = 0.1 # 上限を超えたときに一度に消す割合
+
+
+class AnalysisCache:
+    def __init__(self, path: str = ANALYSIS_CACHE_PATH, max_size: int = ANALYSIS_CACHE_SIZE, version: int = ENGINE_VERSION, touch_interval: float = ANALYSIS_CACHE_TOUCH_INTERVAL) -> None:
+        self.path = path
+        self.max_size = max_size
+        self.version = version
+        self.touch_interval = touch_interval
+        self.conn = None
+        self.pid = None
+        self.size = 0
+        self.lock = threading.Lock() # 先読みのスレッドからも使う
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+
+    # 接続はforkした後のプロセスごとに作る
+    def connect(self) -> sqlite3.Connection:
+        if self.conn is None or self.pid != os.getpid():
+            self.conn = sqlite3.connect(self.path, timeout=5.0, check_same_thread=False)
+            self.pid = os.getpid()
+            self.conn.execute('PRAGMA journal_mode=WAL') # 複数のワーカーから読み書きする
+            self.conn.execute('PRAGMA synchronous=NORMAL')
+            self.conn.execute('''CREATE TABLE IF NOT EXISTS analysis (
+                position BLOB NOT NULL, evaluator TEXT NOT NULL, move INTEGER NOT NULL, score INTEGER NOT NULL,
+                depth INTEGER NOT NULL, version INTEGER NOT NULL, used REAL NOT NULL,
+                PRIMARY KEY (position, evaluator)) WITHOUT ROWID''')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS analysis_used ON analysis (used)')
+            with self.conn:
+                self.conn.execute('DELETE FROM analysis WHERE version != ?', (self.version,))
+            self.size = self.conn.execute('SELECT COUNT(*) FROM analysis').fetchone()[0]
+        return self.conn
+
+    # (最善手の座標, 評価値, 深さ)を返す。なければNone
+    def lookup(self, board: Board, evaluator: str) -> Union[Tuple[Tuple[int, int], int, int], None]:
+        player, opponent, sym = book_key(board)
+        position = player.to_bytes(8, 'little') + opponent.to_bytes(8, 'little')
+        try:
+            with self.lock:
+                conn = self.connect()
+                row = conn.execute('SELECT move, score, depth, used FROM analysis WHERE position = ? AND evaluator = ?', (position, evaluator)).fetchone()
+                now = time.time()
+                if row is not None and now - row[3] > self.touch_interval:
+                    with conn:
+                        conn.execute('UPDATE analysis SET used = ? WHERE position = ? AND evaluator = ?', (now, position, evaluator))
+        except sqlite3.Error:
+            logging.exception('解析キャッシュを読めませんでした')
+            return None
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        sq, score, depth, _ = row
+        return sq2xy(INVERSE_SQUARE_MAP[sym][sq]), score, depth
+
+    # 今ある結果より深いときだけ書き込む
+    def store(self, board: Board, evaluator: str, move: Tuple[int, int], score: int, depth: int) -> None:
+        player, opponent, sym = book_key(board)
+        position = player.to_bytes(8, 'little') + opponent.to_bytes(8, 'little')
+        try:
+            with self.lock:
+                conn = self.connect()
+                with conn:
+                    cursor = conn.execute('''INSERT INTO analysis VALUES (?, ?, ?, ?, ?, ?, ?)
+                        ON CONFLICT (position, evaluator) DO UPDATE SET move = excluded.move, score = excluded.score, depth = excluded.depth, used = excluded.used
+                        WHERE excluded.depth > analysis.depth''',
+                        (position, evaluator, SQUARE_MAP[sym][xy2sq(*move)], int(score), int(depth), self.version, time.time()))
+                    if cursor.rowcount > 0:
+                        # 更新でも増やすので実際より多めになるが、消す前に数え直す
+                        self.writes += 1
+                        self.size += 1
+                    if self.size > self.max_size:
+                        self.evict(conn)
+        except sqlite3.Error:
+            logging.exception('解析キャッシュに書き込めませんでした')
+
+    def evict(self, conn: sqlite3.Connection) -> None:
+        # 他のワーカーも書き込んでいるので、件数は数え直す
+        self.size = conn.execute('SELECT COUNT(*) FROM analysis').fetchone()[0]
+        excess = self.size - self.max_size
+        if excess > 0:
+            num = excess + int(self.max_size * EVICT_RATIO)
+            conn.execute('DELETE FROM analysis WHERE (position, evaluator) IN (SELECT position, evaluator FROM analysis ORDER BY used LIMIT ?)', (num,))
+            self.size = conn.execute('SELECT COUNT(*) FROM analysis').fetchone()[0]
+
+    def hit_rate(self) -> float:
+        return self.hits / (self.hits + self.misses) if self.hits + self.misses > 0 else 0.0
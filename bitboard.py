@@ -0,0 +1,257 @@
+# オセロの盤面クラス(ビットボード版)
+# 黒石・白石をそれぞれ64bitの整数で持ち、着手可能位置と裏返る石をシフトとマスクで求める
+# Boardと同じインターフェースを持つので、Boardの代わりにそのまま使える
+# マス(x, y)はビット (y - 1) * 8 + (x - 1) に対応する(a1が0ビット目、h8が63ビット目)
+
+from typing import Union
+import logging
+import random
+
+import numpy as np
+
+from board import Board, array2bits, bits2array
+from constant import BOARD_SIZE, WHITE, BLACK, LEFT, UPPER_LEFT, UPPER, UPPER_RIGHT, RIGHT, LOWER_RIGHT, LOWER, LOWER_LEFT
+
+
+FULL_MASK = 0xFFFFFFFFFFFFFFFF
+HORIZONTAL_MASK = 0x7E7E7E7E7E7E7E7E # a列とh列を除く(左右方向の回り込み防止)
+VERTICAL_MASK = 0x00FFFFFFFFFFFF00 # 1行目と8行目を除く
+DIAGONAL_MASK = HORIZONTAL_MASK & VERTICAL_MASK
+
+# (方向のフラグ, シフト量, 相手の石にかけるマスク)
+DIRECTIONS = (
+    (LEFT, -1, HORIZONTAL_MASK),
+    (UPPER_LEFT, -9, DIAGONAL_MASK),
+    (UPPER, -8, VERTICAL_MASK),
+    (UPPER_RIGHT, -7, DIAGONAL_MASK),
+    (RIGHT, 1, HORIZONTAL_MASK),
+    (LOWER_RIGHT, 9, DIAGONAL_MASK),
+    (LOWER, 8, VERTICAL_MASK),
+    (LOWER_LEFT, 7, DIAGONAL_MASK),
+)
+
+
+def xy2sq(x: int, y: int) -> int:
+    return int((y - 1) * BOARD_SIZE + (x - 1))
+
+
+def sq2xy(sq: int) -> tuple:
+    return (sq % BOARD_SIZE + 1, sq // BOARD_SIZE + 1)
+
+
+def shift(bits: int, n: int) -> int:
+    return (bits << n) & FULL_MASK if n > 0 else bits >> -n
+
+
+def get_moves(player: int, opponent: int) -> int:
+    # playerが打てるマスのビット列を返す
+    empty = ~(player | opponent) & FULL_MASK
+    moves = 0
+    for _, n, mask in DIRECTIONS:
+        o = opponent & mask
+        t = shift(player, n) & o
+        # 相手の石は最大6個まで連続する
+        t |= shift(t, n) & o
+        t |= shift(t, n) & o
+        t |= shift(t, n) & o
+        t |= shift(t, n) & o
+        t |= shift(t, n) & o
+        moves |= shift(t, n) & empty
+    return moves
+
+
+def get_flips(player: int, opponent: int, sq: int) -> int:
+    # マスsqに打ったときに裏返る石のビット列を返す
+    move = 1 << sq
+    flips = 0
+    for _, n, mask in DIRECTIONS:
+        o = opponent & mask
+        f = 0
+        t = shift(move, n)
+        while t & o:
+            f |= t
+            t = shift(t, n)
+        # 相手の石を挟んで自分の石があれば裏返せる
+        if t & player:
+            flips |= f
+    return flips
+
+
+def get_flip_dirs(player: int, opponent: int, sq: int) -> int:
+    # マスsqに打ったときに裏返せる方向のフラグを返す(Board.movable_dirと同じ形式)
+    move = 1 << sq
+    dirs = 0
+    for dir, n, mask in DIRECTIONS:
+        o = opponent & mask
+        t = shift(move, n)
+        if not t & o:
+            continue
+        while t & o:
+            t = shift(t, n)
+        if t & player:
+            dirs |= dir
+    return dirs
+
+
+def iter_bits(bits: int):
+    # 立っているビットの位置を下位から順に返す
+    while bits:
+        low = bits & -bits
+        yield low.bit_length() - 1
+        bits ^= low
+
+
+class BitBoard(Board):
+    def __init__(self, turn: Union[int, None] = None, color: Union[int, None] = None, board: Union[bytes, None] = None) -> None:
+        format = "%(asctime)s: %(levelname)s: %(pathname)s: line %(lineno)s: %(message)s"
+        logging.basicConfig(filename='/var/log/intern3/flask.log', level=logging.DEBUG, format=format, datefmt='%Y-%m-%d %H:%M:%S')
+
+        # 途中の対戦データがなければ盤面を初期化する
+        if turn is None or color is None or board is None:
+            self.black = (1 << xy2sq(4, 5)) | (1 << xy2sq(5, 4))
+            self.white = (1 << xy2sq(4, 4)) | (1 << xy2sq(5, 5))
+            self.turn = 0
+            self.current_color = WHITE if random.randint(0, 1000) % 2 == 0 else BLACK
+        # 途中の対戦データがあれば反映する(Boardと同じバイト列の形式)
+        else:
+            array = np.frombuffer(board, dtype=np.int8).reshape((BOARD_SIZE + 2, BOARD_SIZE + 2))
+            self.black, self.white = array2bits(array)
+            self.turn = turn
+            self.current_color = color
+
+        self.init_movable()
+
+        # make_moveで打った手を戻すための情報(直前の黒, 白, 手番, 着手可能位置, ターン数)
+        self.undo_stack = []
+
+    def to_bits(self) -> tuple:
+        return self.black, self.white
+
+    # 手番側と相手側のビット列
+    def players(self, color: int) -> tuple:
+        return (self.white, self.black) if color == WHITE else (self.black, self.white)
+
+    def init_movable(self) -> None:
+        player, opponent = self.players(self.current_color)
+        self.movable = get_moves(player, opponent)
+        self._board_cache = None
+        self._movable_pos_cache = None
+
+    # Boardと同じ10x10の配列を必要になったときだけ作る
+    @property
+    def board(self) -> np.ndarray:
+        if self._board_cache is None:
+            self._board_cache = bits2array(self.black, self.white)
+            self._board_cache.flags.writeable = False
+        return self._board_cache
+
+    @board.setter
+    def board(self, board: np.ndarray) -> None:
+        self.black, self.white = array2bits(board)
+        self._board_cache = None
+
+    @property
+    def movable_pos(self) -> np.ndarray:
+        if self._movable_pos_cache is None:
+            movable_pos = np.zeros((BOARD_SIZE + 2, BOARD_SIZE + 2), dtype=np.bool_)
+            for sq in iter_bits(self.movable):
+                movable_pos[sq2xy(sq)] = True
+            movable_pos.flags.writeable = False
+            self._movable_pos_cache = movable_pos
+        return self._movable_pos_cache
+
+    @property
+    def movable_dir(self) -> np.ndarray:
+        player, opponent = self.players(self.current_color)
+        movable_dir = np.zeros((BOARD_SIZE + 2, BOARD_SIZE + 2), dtype=np.uint8)
+        for sq in iter_bits(self.movable):
+            movable_dir[sq2xy(sq)] = get_flip_dirs(player, opponent, sq)
+        return movable_dir
+
+    @property
+    def movable_cnt(self) -> np.ndarray:
+        player, opponent = self.players(self.current_color)
+        movable_cnt = np.zeros((BOARD_SIZE + 2, BOARD_SIZE + 2), dtype=np.uint8)
+        for sq in iter_bits(self.movable):
+            movable_cnt[sq2xy(sq)] = get_flips(player, opponent, sq).bit_count()
+        return movable_cnt
+
+    def check_mobility(self, x: int, y: int, color: int) -> int:
+        player, opponent = self.players(color)
+        sq = xy2sq(x, y)
+        if (player | opponent) >> sq & 1:
+            return 0 # 既に石がある場合はダメ
+        return get_flip_dirs(player, opponent, sq)
+
+    def put_disc(self, x: int, y: int) -> bool:
+        # 置く位置のチェック
+        if x < 1 or BOARD_SIZE < x:
+            return False
+        if y < 1 or BOARD_SIZE < y:
+            return False
+        if not self.movable >> xy2sq(x, y) & 1:
+            return False
+
+        self.make_move(x, y)
+        self.undo_stack.pop() # 対戦中は戻さないので捨てる
+        if not self.movable and not self.is_end():
+            # 相手が打てないのでパスして手番を戻す
+            self.current_color = -self.current_color
+            self.init_movable()
+        return True
+
+    # 打てる手の座標のリスト(Boardと同じくxの小さい順)
+    def legal_moves(self) -> list:
+        return sorted(sq2xy(sq) for sq in iter_bits(self.movable))
+
+    # 合法手であることを確認せずに石を置き、戻すための情報をundo_stackに積む
+    # put_discと違い、相手が打てなくても手番はそのまま相手に渡す(パスはmake_passで明示的に行う)
+    def make_move(self, x: int, y: int) -> None:
+        self.undo_stack.append((self.black, self.white, self.current_color, self.movable, self.turn))
+        self.flip_discs(x, y)
+        self.turn += 1
+        self.current_color = -self.current_color
+        self.init_movable()
+
+    # 手番だけを相手に渡す
+    def make_pass(self) -> None:
+        self.undo_stack.append((self.black, self.white, self.current_color, self.movable, self.turn))
+        self.current_color = -self.current_color
+        self.init_movable()
+
+    # 直前のmake_move/make_passを取り消す
+    def undo_move(self) -> None:
+        self.black, self.white, self.current_color, self.movable, self.turn = self.undo_stack.pop()
+        self._board_cache = None
+        self._movable_pos_cache = None
+
+    def flip_discs(self, x: int, y: int, flip: bool = True) -> int:
+        player, opponent = self.players(self.current_color)
+        sq = xy2sq(x, y)
+        flips = get_flips(player, opponent, sq)
+        if flip:
+            player |= flips | (1 << sq)
+            opponent ^= flips
+            if self.current_color == WHITE:
+                self.white, self.black = player, opponent
+            else:
+                self.black, self.white = player, opponent
+            self._board_cache = None
+        return flips.bit_count()
+
+    def is_end(self) -> bool:
+        if self.movable:
+            return False # 現状打てる手があるならゲーム終了でない
+        opponent, player = self.players(self.current_color)
+        return get_moves(player, opponent) == 0
+
+    def judge_winner(self) -> str:
+        num_black = self.black.bit_count()
+        num_white = self.white.bit_count()
+        text = f'黒：{num_black}枚　白：{num_white}枚\n'
+        if num_black == num_white:
+            return text + '引き分け'
+        elif num_black > num_white:
+            return text + 'あなたの勝ち！\nおめでとう！！'
+        else:
+            return text + 'オセロ君の勝ち'
@@ -1,17 +1,46 @@
 # オセロの盤面クラス
 
-from typing import Union
-import datetime
+from typing import List, Tuple, Union
 import logging
 import random
 
 import numpy as np
-import cv2
 
-from env import IMAGE_DIR
 from constant import BOARD_SIZE, EMPTY, WHITE, BLACK, WALL, LEFT, UPPER_LEFT, UPPER, UPPER_RIGHT, RIGHT, LOWER_RIGHT, LOWER, LOWER_LEFT
 
 
+# 方向ごとの(方向のフラグ, xの増分, yの増分)
+DIR_DELTA = (
+    (LEFT, -1, 0),
+    (UPPER_LEFT, -1, -1),
+    (UPPER, 0, -1),
+    (UPPER_RIGHT, 1, -1),
+    (RIGHT, 1, 0),
+    (LOWER_RIGHT, 1, 1),
+    (LOWER, 0, 1),
+    (LOWER_LEFT, -1, 1),
+)
+
+
+# 盤面の配列とビットボード(マス(x, y)が (y - 1) * 8 + (x - 1) ビット目)の相互変換
+def array2bits(board: np.ndarray) -> tuple:
+    # 10x10の盤面配列を(黒, 白)のビット列に変換する
+    inner = board[1 : BOARD_SIZE+1, 1 : BOARD_SIZE+1].T.reshape(-1) # y行x列の順に並べる
+    weights = 1 << np.arange(BOARD_SIZE * BOARD_SIZE, dtype=np.uint64)
+    black = int(weights[inner == BLACK].sum(dtype=np.uint64))
+    white = int(weights[inner == WHITE].sum(dtype=np.uint64))
+    return black, white
+
+
+def bits2array(black: int, white: int) -> np.ndarray:
+    # (黒, 白)のビット列を10x10の盤面配列に変換する
+    bits = np.array([black, white], dtype=np.uint64).view(np.uint8)
+    bits = np.unpackbits(bits, bitorder='little').reshape(2, BOARD_SIZE, BOARD_SIZE).astype(np.int8)
+    board = np.full((BOARD_SIZE + 2, BOARD_SIZE + 2), WALL, dtype=np.int8)
+    board[1 : BOARD_SIZE+1, 1 : BOARD_SIZE+1] = (bits[1] * WHITE + bits[0] * BLACK).T
+    return board
+
+
 class Board:
     def __init__(self, turn: Union[int, None] = None, color: Union[int, None] = None, board: Union[bytes, None] = None) -> None:
         format = "%(asctime)s: %(levelname)s: %(pathname)s: line %(lineno)s: %(message)s"
@@ -40,21 +69,123 @@ class Board:
             self.turn = turn
             self.current_color = color
 
+        # 手番側と相手側の着手可能情報を両方持っておき、石が変化したマスの周辺だけ更新する
         self.movable_pos = np.zeros((BOARD_SIZE + 2, BOARD_SIZE + 2), dtype=np.bool_)
         self.movable_dir = np.zeros((BOARD_SIZE + 2, BOARD_SIZE + 2), dtype=np.uint8)
         self.movable_cnt = np.zeros((BOARD_SIZE + 2, BOARD_SIZE + 2), dtype=np.uint8)
+        self.movable_num = 0
+        self.opp_movable_pos = np.zeros((BOARD_SIZE + 2, BOARD_SIZE + 2), dtype=np.bool_)
+        self.opp_movable_dir = np.zeros((BOARD_SIZE + 2, BOARD_SIZE + 2), dtype=np.uint8)
+        self.opp_movable_cnt = np.zeros((BOARD_SIZE + 2, BOARD_SIZE + 2), dtype=np.uint8)
+        self.opp_movable_num = 0
         self.init_movable()
 
+        # make_moveで打った手を戻すための情報
+        self.undo_stack = []
+
+    # 盤面全体を走査して両者の着手可能情報を作り直す
     def init_movable(self) -> None:
         self.movable_pos[:, :] = False
+        self.movable_dir[:, :] = 0
         self.movable_cnt[:, :] = 0
+        self.opp_movable_pos[:, :] = False
+        self.opp_movable_dir[:, :] = 0
+        self.opp_movable_cnt[:, :] = 0
+        self.movable_num = 0
+        self.opp_movable_num = 0
         for x in range(1, BOARD_SIZE + 1):
             for y in range(1, BOARD_SIZE + 1):
-                dir = self.check_mobility(x, y, self.current_color)
-                self.movable_dir[x, y] = dir
-                if dir > 0:
-                    self.movable_pos[x, y] = True
-                    self.movable_cnt[x, y] = self.flip_discs(x, y, flip=False)
+                self.set_movable(x, y, self.check_mobility(x, y, self.current_color), self.check_mobility(x, y, -self.current_color))
+
+    # 手番の入れ替えに合わせて着手可能情報を入れ替える
+    def swap_movable(self) -> None:
+        self.movable_pos, self.opp_movable_pos = self.opp_movable_pos, self.movable_pos
+        self.movable_dir, self.opp_movable_dir = self.opp_movable_dir, self.movable_dir
+        self.movable_cnt, self.opp_movable_cnt = self.opp_movable_cnt, self.movable_cnt
+        self.movable_num, self.opp_movable_num = self.opp_movable_num, self.movable_num
+
+    # 1マス分の着手可能情報を両者について書き換える
+    def set_movable(self, x: int, y: int, dir: int, opp_dir: int) -> None:
+        if dir > 0:
+            if not self.movable_pos[x, y]:
+                self.movable_num += 1
+            self.movable_pos[x, y] = True
+            self.movable_cnt[x, y] = len(self.get_flips(x, y, self.current_color, dir))
+        else:
+            if self.movable_pos[x, y]:
+                self.movable_num -= 1
+            self.movable_pos[x, y] = False
+            self.movable_cnt[x, y] = 0
+        self.movable_dir[x, y] = dir
+
+        if opp_dir > 0:
+            if not self.opp_movable_pos[x, y]:
+                self.opp_movable_num += 1
+            self.opp_movable_pos[x, y] = True
+            self.opp_movable_cnt[x, y] = len(self.get_flips(x, y, -self.current_color, opp_dir))
+        else:
+            if self.opp_movable_pos[x, y]:
+                self.opp_movable_num -= 1
+            self.opp_movable_pos[x, y] = False
+            self.opp_movable_cnt[x, y] = 0
+        self.opp_movable_dir[x, y] = opp_dir
+
+    # 石が変化したマスを通る直線上の空きマスについて、その直線の方向だけ着手可能情報を更新する
+    # savedを渡すと書き換える前の着手可能情報を積んでおく(undo_moveで使う)
+    def update_movable(self, changed: List[Tuple[int, int]], saved: Union[list, None] = None) -> None:
+        board = self.board
+        targets = {} # 更新する空きマス -> 調べ直す方向のフラグ
+        for x, y in changed:
+            for i, (_, dx, dy) in enumerate(DIR_DELTA):
+                x_tmp = x + dx
+                y_tmp = y + dy
+                # 石が続いている間は進む(その先の空きマスから逆向きの直線がこのマスを通る)
+                val = board[x_tmp, y_tmp]
+                while val == WHITE or val == BLACK:
+                    x_tmp += dx
+                    y_tmp += dy
+                    val = board[x_tmp, y_tmp]
+                if val == EMPTY:
+                    targets[x_tmp, y_tmp] = targets.get((x_tmp, y_tmp), 0) | DIR_DELTA[(i + 4) % 8][0]
+
+        # 石が置かれたマスにはもう置けない
+        for x, y in changed:
+            if self.movable_pos[x, y] or self.opp_movable_pos[x, y]:
+                if saved is not None:
+                    saved.append(self.get_movable(x, y))
+                self.set_movable(x, y, 0, 0)
+
+        for (x, y), dirs in targets.items():
+            dir = int(self.movable_dir[x, y])
+            opp_dir = int(self.opp_movable_dir[x, y])
+            for d, dx, dy in DIR_DELTA:
+                if not dirs & d:
+                    continue
+                dir &= ~d
+                opp_dir &= ~d
+                # 隣の石と同じ色が続いた先に反対の色があれば、反対の色の手番はこの方向に裏返せる
+                x_tmp = x + dx
+                y_tmp = y + dy
+                first = board[x_tmp, y_tmp]
+                if first != WHITE and first != BLACK:
+                    continue
+                val = first
+                while val == first:
+                    x_tmp += dx
+                    y_tmp += dy
+                    val = board[x_tmp, y_tmp]
+                if val == - first:
+                    if val == self.current_color:
+                        dir |= d
+                    else:
+                        opp_dir |= d
+            if saved is not None:
+                saved.append(self.get_movable(x, y))
+            self.set_movable(x, y, dir, opp_dir)
+
+    def get_movable(self, x: int, y: int) -> tuple:
+        return (x, y, self.movable_pos[x, y], self.movable_dir[x, y], self.movable_cnt[x, y],
+                self.opp_movable_pos[x, y], self.opp_movable_dir[x, y], self.opp_movable_cnt[x, y])
 
     def check_mobility(self, x: int, y: int, color: int) -> int:
         # 注目しているマスの裏返せる方向の情報が入る
@@ -153,109 +284,85 @@ class Board:
         if self.movable_pos[x, y] == 0:
             return False
 
-        self.flip_discs(x, y)
+        self.make_move(x, y)
+        self.undo_stack.pop() # 対戦中は戻さないので捨てる
+        if self.movable_num == 0 and self.opp_movable_num > 0:
+            # 相手が打てないのでパスして手番を戻す
+            self.current_color = -self.current_color
+            self.swap_movable()
+        return True
+
+    # 打てる手の座標のリスト
+    def legal_moves(self) -> List[Tuple[int, int]]:
+        return list(zip(*np.nonzero(self.movable_pos)))
+
+    # 合法手であることを確認せずに石を置き、戻すための情報をundo_stackに積む
+    # put_discと違い、相手が打てなくても手番はそのまま相手に渡す(パスはmake_passで明示的に行う)
+    def make_move(self, x: int, y: int) -> None:
+        color = self.current_color
+        flips = self.get_flips(x, y, color, self.movable_dir[x, y])
+        self.board[x, y] = color
+        for f in flips:
+            self.board[f] = color
         self.turn += 1
+        self.current_color = -color
+        self.swap_movable()
+        movable_num = (self.movable_num, self.opp_movable_num)
+        saved = []
+        self.update_movable([(x, y)] + flips, saved)
+        self.undo_stack.append((x, y, flips, saved, movable_num))
+
+    # 手番だけを相手に渡す(undo_stackにはNoneを積む)
+    def make_pass(self) -> None:
         self.current_color = -self.current_color
-        self.init_movable()
-        if not self.movable_pos.any() and not self.is_end():
+        self.swap_movable()
+        self.undo_stack.append(None)
+
+    # 直前のmake_move/make_passを取り消す
+    def undo_move(self) -> None:
+        record = self.undo_stack.pop()
+        if record is None:
             self.current_color = -self.current_color
-            self.init_movable()
-        return True
+            self.swap_movable()
+            return
+        x, y, flips, saved, movable_num = record
+        for sx, sy, pos, dir, cnt, opp_pos, opp_dir, opp_cnt in reversed(saved):
+            self.movable_pos[sx, sy] = pos
+            self.movable_dir[sx, sy] = dir
+            self.movable_cnt[sx, sy] = cnt
+            self.opp_movable_pos[sx, sy] = opp_pos
+            self.opp_movable_dir[sx, sy] = opp_dir
+            self.opp_movable_cnt[sx, sy] = opp_cnt
+        self.movable_num, self.opp_movable_num = movable_num
+        self.swap_movable()
+        self.current_color = -self.current_color
+        self.turn -= 1
+        self.board[x, y] = EMPTY
+        for f in flips:
+            self.board[f] = -self.current_color
+
+    # (x, y)にcolorの石を置いたとき裏返る石の座標のリストを返す
+    def get_flips(self, x: int, y: int, color: int, dir: int) -> List[Tuple[int, int]]:
+        flips = []
+        for d, dx, dy in DIR_DELTA:
+            if dir & d: # AND演算子
+                x_tmp = x + dx
+                y_tmp = y + dy
+                # 相手の石がある限りループが回る
+                while self.board[x_tmp, y_tmp] == - color:
+                    flips.append((x_tmp, y_tmp))
+                    x_tmp += dx
+                    y_tmp += dy
+        return flips
 
     def flip_discs(self, x: int, y: int, flip: bool = True) -> int:
-        # 石を置く
+        flips = self.get_flips(x, y, self.current_color, self.movable_dir[x, y])
         if flip:
+            # 石を置いて、相手の石があるマスを自分の石の色に塗り替える
             self.board[x, y] = self.current_color
-        
-        # 以下石を裏返す
-        # MovableDirの(y, x)座標をdirに代入
-        dir = self.movable_dir[x, y]
-        flip_count = 0
-
-        ## 左
-        if dir & LEFT: # AND演算子
-            x_tmp = x - 1
-            # 相手の石がある限りループが回る
-            while self.board[x_tmp, y] == - self.current_color:
-                if flip:
-                    # 相手の石があるマスを自分の石の色に塗り替えている
-                    self.board[x_tmp, y] = self.current_color
-                flip_count += 1
-                # さらに1マス左に進めてループを回す
-                x_tmp -= 1
-
-        ## 左上
-        if dir & UPPER_LEFT:
-            x_tmp = x - 1
-            y_tmp = y - 1
-            while self.board[x_tmp, y_tmp] == - self.current_color:
-                if flip:
-                    self.board[x_tmp, y_tmp] = self.current_color
-                flip_count += 1
-                x_tmp -= 1
-                y_tmp -= 1
-
-        ## 上
-        if dir & UPPER:
-            y_tmp = y - 1
-            while self.board[x, y_tmp] == - self.current_color:
-                if flip:
-                    self.board[x, y_tmp] = self.current_color
-                flip_count += 1
-                y_tmp -= 1
-
-        ## 右上
-        if dir & UPPER_RIGHT:
-            x_tmp = x + 1
-            y_tmp = y - 1
-            while self.board[x_tmp, y_tmp] == - self.current_color:
-                if flip:
-                    self.board[x_tmp, y_tmp] = self.current_color
-                flip_count += 1
-                x_tmp += 1
-                y_tmp -= 1
-
-        ## 右
-        if dir & RIGHT:
-            x_tmp = x + 1
-            while self.board[x_tmp, y] == - self.current_color:
-                if flip:
-                    self.board[x_tmp, y] = self.current_color
-                flip_count += 1
-                x_tmp += 1
-
-        ## 右下
-        if dir & LOWER_RIGHT:
-            x_tmp = x + 1
-            y_tmp = y + 1
-            while self.board[x_tmp, y_tmp] == - self.current_color:
-                if flip:
-                    self.board[x_tmp, y_tmp] = self.current_color
-                flip_count += 1
-                x_tmp += 1
-                y_tmp += 1
-
-        ## 下
-        if dir & LOWER:
-            y_tmp = y + 1
-            while self.board[x, y_tmp] == - self.current_color:
-                if flip:
-                    self.board[x, y_tmp] = self.current_color
-                flip_count += 1
-                y_tmp += 1
-
-        ## 左下
-        if dir & LOWER_LEFT:
-            x_tmp = x - 1
-            y_tmp = y + 1
-            while self.board[x_tmp, y_tmp] == - self.current_color:
-                if flip:
-                    self.board[x_tmp, y_tmp] = self.current_color
-                flip_count += 1
-                x_tmp -= 1
-                y_tmp += 1
-
-        return flip_count
+            for f in flips:
+                self.board[f] = self.current_color
+        return len(flips)
 
     def put_max_pos(self) -> None:
         max_idx = np.unravel_index(np.argmax(self.movable_cnt), self.movable_cnt.shape)
@@ -263,13 +370,8 @@ class Board:
         self.put_disc(max_idx[0], max_idx[1])
 
     def is_end(self) -> bool:
-        if self.movable_pos.any():
-            return False # 現状打てる手があるならゲーム終了でない
-        for x in range(1, BOARD_SIZE + 1):
-            for y in range(1, BOARD_SIZE + 1):
-                if self.check_mobility(x, y, -self.current_color) > 0:
-                    return False # 置ける場所が1つでもある場合はゲーム終了でない
-        return True
+        # 両者とも打てる手がなければゲーム終了
+        return self.movable_num == 0 and self.opp_movable_num == 0
 
     def judge_winner(self) -> str:
         num_white = 0; num_black = 0
@@ -290,19 +392,20 @@ class Board:
     def to_bytes(self) -> bytes:
         return self.board.tobytes()
 
-    def to_image(self, user_id: str) -> str:
-        img = cv2.imread(IMAGE_DIR + 'board_template.png')
-        for x in range(1, BOARD_SIZE + 1):
-            draw_x = x * 50 + 25
-            for y in range(1, BOARD_SIZE + 1):
-                draw_y = y * 50 + 25
-                if self.board[x, y] == BLACK:
-                    cv2.circle(img, (draw_x, draw_y), 20, (0, 0, 0), thickness=-1)
-                elif self.board[x, y] == WHITE:
-                    cv2.circle(img, (draw_x, draw_y), 20, (255, 255, 255), thickness=-1)
-        img_path = IMAGE_DIR + user_id + '-' + datetime.datetime.now().strftime('%H%M%S%f') + '.png'
-        cv2.imwrite(img_path, img)
-        return img_path
+    # (黒, 白)のビット列を返す
+    def to_bits(self) -> Tuple[int, int]:
+        return array2bits(self.board)
+
+    # 手番側と相手側のビット列
+    def players(self, color: int) -> Tuple[int, int]:
+        black, white = self.to_bits()
+        return (white, black) if color == WHITE else (black, white)
+
+    # 盤面の画像のパスを返す(同じ盤面なら同じパス)
+    # last_moveを指定するとそのマスに印を付け、show_movesなら合法手に印を付ける
+    def to_image(self, last_move: Union[Tuple[int, int], None] = None, show_moves: bool = False) -> str:
+        from image_cache import image_cache # image_cacheがBoardを使うのでここで読み込む
+        return image_cache.get(self, last_move, show_moves)
 
 
     def to_string(self) -> str:
@@ -1,5 +1,6 @@
 RESET_WORDS = ['終了', '終わり', 'おわり', 'リセット']
 HISTORY_WORDS = ['履歴', '過去', '一覧', '対戦履歴']
+HINT_WORDS = ['ヒント', 'ひんと', 'hint', 'Hint']
 
 BOARD_SIZE = 8 # ボードサイズ
 EMPTY = 0 # 空きマス
@@ -16,3 +17,43 @@ RIGHT = 2 ** 4 # = 1 右方向にひっくり返せるか
 LOWER_RIGHT = 2 ** 5 # = 1 右下方向にひっくり返せるか
 LOWER = 2 ** 6 # = 1 下方向にひっくり返せるか
 LOWER_LEFT = 2 ** 7 # = 1 左下方向にひっくり返せるか
+
+TT_SIZE = 2 ** 18 # 置換表のエントリ数(1エントリ16バイト)
+TT_SHM_NAME = 'othello_kun_tt' # ワーカー間で共有する置換表の共有メモリの名前
+TT_SHM_ENV = 'OTHELLO_KUN_SHARED_TT' # この環境変数が'1'のプロセスだけが共有の置換表を開く(guniconf.pyが設定する)
+MAX_SEARCH_DEPTH = 60 # 反復深化で探索する最大の深さ
+SEARCH_TIME_LIMIT = 2.0 # AIが1手の探索に使う時間(秒)
+ENDGAME_EMPTIES = 10 # 空きマスがこの数以下になったら終局まで読み切る(10個なら石の差まで1秒以内にほぼ読み切れる)
+ENDGAME_TIME_RATIO = 0.5 # 読み切りに使う時間の割合(読み切れなければ残りの時間で普通に探索する)
+ENDGAME_MAX_NODES = 200000 # 時間を決めずに探索するときに読み切りで調べる局面数の上限
+SEARCH_WORKERS = 1 # ルートの手を並列に探索するプロセス数(1なら並列化しない)
+OPENING_BOOK_PATH = './opening_book.bin' # 定石の本のファイル(opening_book.pyで作る)
+ANALYSIS_CACHE_PATH = './analysis_cache.sqlite3' # 深く探索できた局面の結果を残しておくファイル(Noneなら使わない)
+ANALYSIS_CACHE_SIZE = 1000000 # 解析キャッシュに残す局面数の上限
+ANALYSIS_CACHE_MIN_DEPTH = 7 # この深さ以上探索できた結果だけを解析キャッシュに残し、使う(2秒の探索では中盤で6-7、終盤で8-10くらいまで読める。石の差まで読み切れたら空きマスの数を深さとする)
+ANALYSIS_CACHE_TOUCH_INTERVAL = 3600 # 解析キャッシュで使った結果の最後に使った時刻は、これ(秒)より古いときだけ書き直す(読むたびに書き込まないように)
+ENGINE_VERSION = 1 # 探索や評価関数を変えて結果が変わるときに上げる(解析キャッシュの古い結果を捨てる)
+PATTERN_WEIGHTS_PATH = './pattern_weights.bin' # パターン評価の重みのファイル(なければマスごとの重みから作る)
+EVALUATOR = 'positional' # 評価関数('positional': マスごとの重み, 'pattern': パターン)
+PONDERING = False # 相手の手番の間に、相手の手ごとにAIの手を先読みしておくか(ワーカーが1つのときに効く。ponder.py参照)
+PONDER_TIME_LIMIT = 4.0 # 先読みで相手の1手あたりに使う時間(秒)
+PONDER_EXPIRE = 600 # 先読みの結果を覚えておく時間(秒)
+PONDER_CACHE_SIZE = 1000 # 先読みの結果を覚えておく局面数の上限(全ユーザ合計)
+IMAGE_CACHE_SIZE = 10000 # 盤面の画像のパスをメモリに覚えておく数
+IMAGE_MEMORY_CACHE_BYTES = 64 * 2 ** 20 # ワーカーごとにメモリに持っておく画像のバイト数の上限
+IMAGE_URL_PATH = 'image/' # 盤面の画像を返すURLのパス(SERVER_DOMAINからの相対。nginxからFlaskに渡す)
+IMAGE_FORMAT = 'png' # Board.to_imageで書き出す画像の形式('png': 8ビットのパレットPNG, 'webp': 可逆のWebP)。LINEはJPEGとPNGしか受け付けないので、LINEに送るURLは常にpng
+IMAGE_PNG_COMPRESSION = 6 # PNGの圧縮レベル(0-9。大きいほど小さくなるが遅い)
+IMAGE_PREVIEW_SIZE = 240 # プレビュー画像の大きさ(ピクセル)
+RETENTION = True # 古い画像と動画を消すスレッドを動かすか
+RETENTION_TTL = 7 * 24 * 60 * 60 # 画像と動画を残しておく時間(秒)
+RETENTION_MAX_BYTES = 2 * 2 ** 30 # 画像と動画の合計のバイト数の上限(超えたら古いものから消す)
+RETENTION_MIN_AGE = 60 * 60 # これより新しいファイルは容量を超えていても消さない(LINEがまだ取りに来る)(秒)
+RETENTION_INTERVAL = 10 * 60 # 掃除を一周してから次に始めるまでの時間(秒)
+RETENTION_SCAN_BATCH = 500 # 掃除で休まずに調べるファイル数
+RETENTION_BATCH_PAUSE = 0.05 # 掃除でRETENTION_SCAN_BATCH個調べるごとに休む時間(秒)
+RETENTION_LOCK_PATH = './janitor.lock' # 掃除するワーカーを1つに決めるためのロックファイル
+RETENTION_METRICS_PATH = './janitor_metrics.json' # 掃除の統計を書き込むファイル(Noneなら書かない)
+HINT_MOVES = 3 # ヒントで見せる手の数
+HINT_TIME_LIMIT = 0.5 # ヒントの探索に使う時間(秒)
+HINT_MAX_NODES = 50000 # ヒントの探索で調べる局面数の上限
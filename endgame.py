@@ -0,0 +1,105 @@
+# 終盤の完全読み
+# 空きマスが少なくなったら評価関数を使わずに終局まで読み切る
+# 盤面オブジェクトは使わず、(手番側, 相手側)のビット列だけで探索する
+
+from typing import Tuple, Union
+import threading
+import time
+
+from bitboard import get_moves, get_flips, iter_bits, sq2xy, FULL_MASK
+from board import Board
+from constant import WHITE
+
+
+WLD = 0 # 勝ち・負け・引き分けだけを求める
+EXACT_DISCS = 1 # 最終的な石の差まで求める
+
+FASTEST_FIRST_EMPTIES = 7 # 空きマスがこれより多いときは相手の打てる手が少なくなる手から調べる
+
+# 盤面を4つに分けた領域(偶数理論: 空きマスが奇数個の領域に先に打つ)
+QUADRANTS = (0x000000000F0F0F0F, 0x00000000F0F0F0F0, 0x0F0F0F0F00000000, 0xF0F0F0F000000000)
+
+
+class EndgameTimeout(Exception):
+    pass
+
+
+class EndgameSolver:
+    def __init__(self, deadline: Union[float, None] = None, stop: Union[threading.Event, None] = None, max_nodes: Union[int, None] = None) -> None:
+        self.deadline = deadline
+        self.stop = stop
+        self.max_nodes = max_nodes # 調べる局面数の上限(超えたら時間切れと同じように打ち切る)
+        self.nodes = 0
+
+    # 手番側から見た最終的な石の差を返す(fail-soft)
+    def solve(self, player: int, opponent: int, alpha: int, beta: int, passed: bool = False) -> int:
+        self.nodes += 1
+        if self.nodes & 0xFF == 0 and ((self.deadline is not None and time.perf_counter() > self.deadline) or (self.stop is not None and self.stop.is_set())):
+            raise EndgameTimeout()
+        if self.max_nodes is not None and self.nodes > self.max_nodes:
+            raise EndgameTimeout()
+
+        moves = get_moves(player, opponent)
+        if not moves:
+            if passed:
+                # 両者とも打てないので終局
+                return player.bit_count() - opponent.bit_count()
+            return -self.solve(opponent, player, -beta, -alpha, True)
+
+        empties = ~(player | opponent) & FULL_MASK
+        best = -64
+        for sq in self.order(player, opponent, moves, empties):
+            flips = get_flips(player, opponent, sq)
+            next_player = opponent ^ flips
+            next_opponent = player | flips | (1 << sq)
+            score = -self.solve(next_player, next_opponent, -beta, -max(alpha, best))
+            if score > best:
+                best = score
+                if best >= beta:
+                    break
+        return best
+
+    # 調べる順に並べたマス番号のリスト
+    def order(self, player: int, opponent: int, moves: int, empties: int) -> list:
+        odd = 0
+        for quadrant in QUADRANTS:
+            if (empties & quadrant).bit_count() & 1:
+                odd |= quadrant
+        if empties.bit_count() <= FASTEST_FIRST_EMPTIES:
+            # 残りが少ないときは並べ替えの手間を惜しんで偶数理論だけ使う
+            return list(iter_bits(moves & odd)) + list(iter_bits(moves & ~odd))
+        keyed = []
+        for sq in iter_bits(moves):
+            flips = get_flips(player, opponent, sq)
+            mobility = get_moves(opponent ^ flips, player | flips | (1 << sq)).bit_count()
+            keyed.append((mobility, 0 if odd >> sq & 1 else 1, sq))
+        keyed.sort()
+        return [sq for _, _, sq in keyed]
+
+    # ルートの(最善の評価値, 最善手のマス番号)を返す
+    def solve_root(self, player: int, opponent: int, mode: int = EXACT_DISCS) -> Tuple[int, int]:
+        moves = get_moves(player, opponent)
+        empties = ~(player | opponent) & FULL_MASK
+        alpha, beta = (-1, 1) if mode == WLD else (-64, 64)
+        best, best_sq = -65, -1
+        for sq in self.order(player, opponent, moves, empties):
+            flips = get_flips(player, opponent, sq)
+            score = -self.solve(opponent ^ flips, player | flips | (1 << sq), -beta, -max(alpha, best))
+            if score > best:
+                best, best_sq = score, sq
+                if best >= beta:
+                    break
+        return best, best_sq
+
+
+# 盤面の手番側について終局まで読み切り、(石の差, 最善手の座標)を返す
+# WLDのときの石の差は勝ちなら正、負けなら負、引き分けなら0であることだけが正しい
+# WLDで負けのときは全ての手が窓の下に外れただけなので、返す手は最善手とは限らない
+# solverを渡すとその探索局面数に足していく(deadlineはsolverのものを使う)
+def solve_board(board: Board, mode: int = EXACT_DISCS, deadline: Union[float, None] = None, solver: Union[EndgameSolver, None] = None) -> Tuple[int, Tuple[int, int]]:
+    black, white = board.to_bits()
+    player, opponent = (white, black) if board.current_color == WHITE else (black, white)
+    if solver is None:
+        solver = EndgameSolver(deadline)
+    score, sq = solver.solve_root(player, opponent, mode)
+    return score, sq2xy(sq)
@@ -0,0 +1,90 @@
+# 盤面の評価関数
+# マスごとの重みの表はimportしたときに1回だけ作り、盤面はビット列(手番側, 相手側)で受け取る
+# 探索の末端ではたくさんの盤面をまとめてNumPyで1回で評価する
+# 評価関数はreset / make_move / undo_move / evaluate / evaluate_children を持つオブジェクトで、探索はこれを通して使う
+# (パターンによる評価関数はpattern.py)
+
+from typing import List, Sequence, Tuple, Union
+import numpy as np
+
+from board import Board
+from constant import BOARD_SIZE, EVALUATOR
+
+
+# マスの重み(外周の壁を含む10x10、board[x, y]と同じ並び)
+BOARD_POINT = np.array([
+    [-120, -120, -120, -120, -120, -120, -120, -120, -120, -120],
+    [-120,  120,  -20,   20,    5,    5,   20,  -20,  120, -120],
+    [-120,  -20,  -40,   -5,   -5,   -5,   -5,  -40,  -20, -120],
+    [-120,   20,   -5,   15,    3,    3,   15,   -5,   20, -120],
+    [-120,    5,   -5,    3,    3,    3,    3,   -5,    5, -120],
+    [-120,    5,   -5,    3,    3,    3,    3,   -5,    5, -120],
+    [-120,   20,   -5,   15,    3,    3,   15,   -5,   20, -120],
+    [-120,  -20,  -40,   -5,   -5,   -5,   -5,  -40,  -20, -120],
+    [-120,  120,  -20,   20,    5,    5,   20,  -20,  120, -120],
+    [-120, -120, -120, -120, -120, -120, -120, -120, -120, -120]
+], dtype=np.int32)
+
+# ビット列のマス番号 sq = (y - 1) * 8 + (x - 1) の順に並べた重み
+WEIGHTS = np.ascontiguousarray(BOARD_POINT[1:BOARD_SIZE + 1, 1:BOARD_SIZE + 1].T).reshape(-1)
+
+# 1行(8マス)分のビットの並びごとの重みの合計 ROW_WEIGHTS[行][ビットの並び](1つの盤面を評価するとき用)
+ROW_WEIGHTS = [
+    [int(sum(WEIGHTS[row * BOARD_SIZE + i] for i in range(BOARD_SIZE) if bits >> i & 1)) for bits in range(256)]
+    for row in range(BOARD_SIZE)
+]
+
+
+# 手番側から見た評価値(1つの盤面)
+def evaluate_bits(player: int, opponent: int) -> int:
+    score = 0
+    for row in ROW_WEIGHTS:
+        score += row[player & 0xFF] - row[opponent & 0xFF]
+        player >>= 8
+        opponent >>= 8
+    return score
+
+
+def evaluate(board: Board) -> int:
+    return evaluate_bits(*board.players(board.current_color))
+
+
+# 手番側から見た評価値をまとめて求める(playersとopponentsは同じ長さのビット列の並び)
+def evaluate_batch(players: Sequence[int], opponents: Sequence[int]) -> np.ndarray:
+    bits = np.array([players, opponents], dtype='<u8').view(np.uint8).reshape(2, -1, 8)
+    # (2, 盤面の数, 64)の0/1の配列にして重みとの内積を取る
+    discs = np.unpackbits(bits, axis=2, bitorder='little')
+    return discs[0] @ WEIGHTS - discs[1] @ WEIGHTS
+
+
+# マスごとの重みによる評価(局面の状態を持たないので、打つ・戻すときは何もしない)
+class PositionalEvaluator:
+    name = 'positional'
+
+    def reset(self, board: Board) -> None:
+        pass
+
+    def make_move(self, board: Board) -> None:
+        pass
+
+    def undo_move(self) -> None:
+        pass
+
+    def evaluate(self, board: Board) -> int:
+        return evaluate(board)
+
+    # boardに打った子の局面(子の手番側, 子の相手側)の評価値を、子の手番側から見た値で返す
+    def evaluate_children(self, board: Board, children: Sequence[Tuple[int, int]]) -> List[int]:
+        players, opponents = zip(*children)
+        return evaluate_batch(players, opponents).tolist()
+
+
+# 名前から評価関数を作る
+# 評価関数は探索中の局面の状態を持つので、呼ぶたびに新しく作る(探索ごとに別のオブジェクトを使う。重みの表は共有する)
+def get_evaluator(name: str = EVALUATOR) -> Union[PositionalEvaluator, 'PatternEvaluator']:
+    if name == PositionalEvaluator.name:
+        return PositionalEvaluator()
+    if name == 'pattern':
+        from pattern import PatternEvaluator # patternはこのモジュールの重みを使うので、循環しないようにここで読む
+        return PatternEvaluator()
+    raise ValueError(f'unknown evaluator: {name}')
@@ -4,5 +4,42 @@ logconfig = None
 
 reload = True
 
+# 探索(1手2秒)の間もLINEからの画像の取得を待たせないように、ワーカーを複数にする
+# (先読みの結果はワーカーごとに持つので、PONDERINGを使うときはponder.pyの注意を参照)
+workers = 4
+
 # socket_path = 'unix:/run/gunicorn-flask-intern3.sock'
 # bind = socket_path
+
+
+# 置換表をワーカー間で共有するために、ワーカーをforkする前に共有メモリに作っておく
+# 各ワーカーはアプリを読み込むとき(alpha_beta.pyのimport)に名前で開く(開くのは環境変数TT_SHM_ENVが'1'のプロセスだけ)
+# preload_appを使うとマスターがこれより先にアプリを読み込んでしまうので使わないこと
+def on_starting(server):
+    global shared_tt
+    import os
+    from constant import TT_SHM_ENV
+    from transposition import SharedTranspositionTable
+    shared_tt = SharedTranspositionTable.create()
+    os.environ[TT_SHM_ENV] = '1' # forkしたワーカーに引き継がれる
+    server.log.info(f'shared transposition table: {shared_tt.shm.name} ({shared_tt.shm.size} bytes)')
+
+
+# ワーカーが終わるときに共有の置換表を閉じる(配列が共有メモリを参照したまま終わると、終了時にBufferErrorが出る)
+# ワーカーで開いたもの(alpha_beta.transposition_table)と、forkでマスターから引き継いだshared_ttの両方を閉じる
+# 共有メモリを消すのはマスター(on_exit)だけ
+def worker_exit(server, worker):
+    import sys
+    from transposition import SharedTranspositionTable
+    index = sys.modules.get('index')
+    if index is not None and index.ponderer is not None:
+        index.ponderer.stop() # 先読みの探索が置換表を使っている間は閉じない
+    alpha_beta = sys.modules.get('alpha_beta')
+    if alpha_beta is not None and isinstance(alpha_beta.transposition_table, SharedTranspositionTable):
+        alpha_beta.transposition_table.close()
+    shared_tt.close()
+
+
+def on_exit(server):
+    shared_tt.close()
+    shared_tt.unlink()
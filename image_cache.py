@@ -0,0 +1,152 @@
+# 盤面の画像のキャッシュ
+# 画像は盤面と描き方(印の付け方)から作るキー(そこから盤面を戻せる短い文字列)で表す
+# 同じ盤面の画像は同じキー・同じURLになるので、1回しか作らず、nginxやCDN・LINEのクライアントにもキャッシュしてもらえる
+#   ImageCache        : キーごとにファイルに書き出す(Board.to_image用)
+#   EncodedImageCache : キーごとに画像のバイト列をメモリに持つ(index.pyの画像のURL用。ファイルは書かない)
+# 画像の形式はURLの拡張子で決まる。LINEはJPEGとPNGしか受け付けないので、LINEに送るURL(image_path)は常にpng
+# (webpは拡張子を.webpにしたURLで返すが、LINEには使わない)。縮小したプレビューはURLのpreview/の下に置く
+# ファイルに書き出すとき(ImageCache)の形式はIMAGE_FORMATで決まる
+# 描き方を変えたらRENDER_VERSIONを上げる(URLとファイル名が変わる)
+
+from collections import OrderedDict
+from typing import Tuple, Union
+import base64
+import os
+import re
+import threading
+
+from bitboard import BitBoard, xy2sq, sq2xy
+from board import Board, bits2array
+from env import IMAGE_DIR
+from constant import IMAGE_CACHE_SIZE, IMAGE_MEMORY_CACHE_BYTES, IMAGE_URL_PATH, IMAGE_FORMAT, WHITE, BLACK
+from renderer import get_renderer
+
+
+RENDER_VERSION = 1 # 描き方を変えたら上げる
+LINE_IMAGE_FORMAT = 'png' # LINEに送る画像の形式(LINEはJPEGとPNGだけ)
+KEY_BYTES = 18 # キーのバイト数(黒8 + 白8 + 最後に打った手1 + 合法手の印1)
+KEY_PATTERN = re.compile(r'[A-Za-z0-9_-]{24}') # キーの文字列(18バイトのbase64はちょうど24文字で、=は付かない)
+
+
+# 盤面と描き方からキーを作る(base64の24文字)
+# 最後に打った手はマスの番号 + 1(なければ0)、合法手の印は手番が黒なら1・白なら2(付けないなら0)
+def image_key(board: Board, last_move: Union[Tuple[int, int], None] = None, show_moves: bool = False) -> str:
+    black, white = board.to_bits()
+    data = black.to_bytes(8, 'little') + white.to_bytes(8, 'little')
+    data += bytes([0 if last_move is None else xy2sq(*last_move) + 1])
+    data += bytes([0 if not show_moves else 1 if board.current_color == BLACK else 2])
+    return base64.urlsafe_b64encode(data).decode()
+
+
+# キーから(盤面, 最後に打った手, 合法手の印を付けるか)に戻す。正しくないキーならValueError
+def parse_image_key(key: str) -> Tuple[BitBoard, Union[Tuple[int, int], None], bool]:
+    # b64decodeはbase64以外の文字を黙って読み飛ばすので、先に文字を確かめる(同じ盤面に別のURLができないように)
+    if KEY_PATTERN.fullmatch(key) is None:
+        raise ValueError(f'invalid image key: {key}')
+    data = base64.urlsafe_b64decode(key)
+    if len(data) != KEY_BYTES or data[16] > 64 or data[17] > 2:
+        raise ValueError(f'invalid image key: {key}')
+    black = int.from_bytes(data[0:8], 'little')
+    white = int.from_bytes(data[8:16], 'little')
+    if black & white:
+        raise ValueError(f'invalid image key: {key}')
+    color = WHITE if data[17] == 2 else BLACK
+    board = BitBoard(black.bit_count() + white.bit_count() - 4, color, bits2array(black, white).tobytes())
+    last_move = sq2xy(data[16] - 1) if data[16] > 0 else None
+    return board, last_move, data[17] > 0
+
+
+# 盤面の画像のURLのパス(SERVER_DOMAINからの相対)
+def image_path(board: Board, last_move: Union[Tuple[int, int], None] = None, show_moves: bool = False, preview: bool = False, format: str = LINE_IMAGE_FORMAT) -> str:
+    return f'{IMAGE_URL_PATH}v{RENDER_VERSION}/{"preview/" if preview else ""}{image_key(board, last_move, show_moves)}.{format}'
+
+
+# 画像のURL(パス)から同じ盤面のプレビューのURLを作る
+def preview_path(path: str) -> str:
+    directory, _, name = path.rpartition('/')
+    return f'{directory}/preview/{name}'
+
+
+class ImageCache:
+    def __init__(self, directory: str = IMAGE_DIR, max_size: int = IMAGE_CACHE_SIZE) -> None:
+        self.directory = directory
+        self.max_size = max_size
+        self.index = OrderedDict() # キー → 画像のパス(最近使ったものが後ろ)
+        self.lock = threading.Lock()
+        self.hits = 0 # メモリにあった
+        self.file_hits = 0 # メモリにはなかったがファイルがあった
+        self.misses = 0 # 描いて書き出した
+
+    def path(self, key: str) -> str:
+        return f'{self.directory}board-v{RENDER_VERSION}-{key}.{IMAGE_FORMAT}'
+
+    # 盤面の画像のパスを返す(なければ作る)
+    def get(self, board: Board, last_move: Union[Tuple[int, int], None] = None, show_moves: bool = False) -> str:
+        key = image_key(board, last_move, show_moves)
+        with self.lock:
+            path = self.index.get(key)
+            if path is not None:
+                self.index.move_to_end(key)
+        # 掃除係(janitor.py)が古いファイルを消すので、覚えていてもファイルがあるかは確かめる
+        if path is not None and os.path.exists(path):
+            with self.lock:
+                self.hits += 1
+            return path
+        path = self.path(key)
+        exists = os.path.exists(path)
+        if not exists:
+            # 他のワーカーが同じ画像を書いている途中のファイルを読まれないように、別名で書いてから置き換える
+            tmp_path = f'{self.directory}board-v{RENDER_VERSION}-{key}.{os.getpid()}-{threading.get_ident()}.{IMAGE_FORMAT}'
+            get_renderer().write(tmp_path, board, last_move, show_moves)
+            os.replace(tmp_path, path)
+        with self.lock:
+            if exists:
+                self.file_hits += 1
+            else:
+                self.misses += 1
+            self.index[key] = path
+            if len(self.index) > self.max_size:
+                self.index.popitem(last=False)
+        return path
+
+    def hit_rate(self) -> float:
+        total = self.hits + self.file_hits + self.misses
+        return (self.hits + self.file_hits) / total if total > 0 else 0.0
+
+
+class EncodedImageCache:
+    def __init__(self, max_bytes: int = IMAGE_MEMORY_CACHE_BYTES) -> None:
+        self.max_bytes = max_bytes
+        self.images = OrderedDict() # (キー, 形式, プレビューか) → 画像のバイト列(最近使ったものが後ろ)
+        self.bytes = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    # キーの画像のバイト列を返す(なければ作る)。正しくないキーや形式ならValueError
+    def get(self, key: str, format: str = LINE_IMAGE_FORMAT, preview: bool = False) -> bytes:
+        cache_key = (key, format, preview)
+        with self.lock:
+            data = self.images.get(cache_key)
+            if data is not None:
+                self.images.move_to_end(cache_key)
+                self.hits += 1
+                return data
+        board, last_move, show_moves = parse_image_key(key)
+        data = get_renderer().encode(board, last_move, show_moves, format, preview)
+        with self.lock:
+            self.misses += 1
+            if cache_key not in self.images:
+                self.images[cache_key] = data
+                self.bytes += len(data)
+            while self.bytes > self.max_bytes and self.images:
+                _, old = self.images.popitem(last=False)
+                self.bytes -= len(old)
+        return data
+
+    def hit_rate(self) -> float:
+        return self.hits / (self.hits + self.misses) if self.hits + self.misses > 0 else 0.0
+
+
+image_cache = ImageCache()
+encoded_image_cache = EncodedImageCache()
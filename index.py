@@ -16,20 +16,29 @@ import subprocess
 
 # サードパーティモジュールのインポート
 import cv2
-from flask import Flask, request
+from flask import Flask, request, abort
 
 # 自分で作成したモジュールのインポート
-from alpha_beta import act_alpha_beta
-from board import Board
+from alpha_beta import act_alpha_beta, analyze
+from bitboard import BitBoard as Board # ビットボード版の盤面を使う
 from database import Database
-from env import ACCESS_TOKEN, SERVER_DOMAIN, IMAGE_DIR, VIDEO_DIR
-from constant import RESET_WORDS, HISTORY_WORDS, BOARD_SIZE, WHITE
+from env import ACCESS_TOKEN, SERVER_DOMAIN, VIDEO_DIR
+from constant import RESET_WORDS, HISTORY_WORDS, HINT_WORDS, BOARD_SIZE, WHITE, BLACK, SEARCH_TIME_LIMIT, PONDERING, HINT_MOVES, HINT_TIME_LIMIT, HINT_MAX_NODES, IMAGE_URL_PATH, RETENTION
+from image_cache import image_path, preview_path, encoded_image_cache, RENDER_VERSION
+from janitor import Janitor
+from ponder import Ponderer
+from renderer import get_renderer, IMAGE_FORMATS
 
 
 # Flaskクラスをnewしてappに代入
 # gunicornの起動コマンドに使用しているのでここは変更しないこと
 app = Flask(__name__)
 database = Database()
+ponderer = Ponderer() if PONDERING else None # ユーザの手番の間にAIの手を先読みする
+janitor = Janitor() if RETENTION else None # 古い画像と動画を消す
+if janitor is not None:
+    janitor.start()
+START_PREVIEW_PATH = image_path(Board(None, BLACK, None), preview=True) # 初期盤面のプレビュー画像(プレビューを指定しない動画に使う)
 
 # ログの設定
 format = "%(asctime)s: %(levelname)s: %(pathname)s: line %(lineno)s: %(message)s"
@@ -55,15 +64,16 @@ def pos2xy(pos: str) -> Tuple[Union[int, None], Union[int, None]]:
     return (x, y)
 
 
-# 複数の画像のパスから動画を作成する
-def make_video(image_paths: List[str], user_id: str) -> str:
+# 複数の盤面から動画を作成する(画像はファイルに書かずにメモリ上で描く)
+def make_video(boards: List[Board], user_id: str) -> str:
     fourcc = cv2.VideoWriter_fourcc(*'MP4V')
     file_name = user_id + '-' + datetime.datetime.now().strftime('%H%M%S%f') + '.mp4' # LINEはmp4コーデックオンリー
-    writer = cv2.VideoWriter(f'{VIDEO_DIR}-pre{file_name}', fourcc, 2, (460, 460))
-    for ip in image_paths:
-        img = cv2.imread(ip)
-        writer.write(img)
-        os.remove(ip)
+    renderer = get_renderer()
+    height, width = renderer.template.shape[:2]
+    writer = cv2.VideoWriter(f'{VIDEO_DIR}-pre{file_name}', fourcc, 2, (width, height))
+    with renderer.lock:
+        for board in boards:
+            writer.write(renderer.render(board))
     writer.release()
     # そのままだと見れないのでエンコード
     subprocess.call(f'ffmpeg -i "{VIDEO_DIR}-pre{file_name}" "{VIDEO_DIR}{file_name}"', shell=True)
@@ -72,20 +82,24 @@ def make_video(image_paths: List[str], user_id: str) -> str:
 
 
 # メッセージ群と送信先からレスポンスを作成する
-def make_response(texts: List[str], receiver : str, is_push: bool = False) -> Tuple[Dict[str, str], Dict[str, str]]:
+# 動画は(動画のURL, プレビュー画像のURL)でも指定できる
+def make_response(texts: List[Union[str, Tuple[str, str]]], receiver : str, is_push: bool = False) -> Tuple[Dict[str, str], Dict[str, str]]:
     messages = []
     for txt in texts:
-        if txt.startswith(SERVER_DOMAIN + IMAGE_DIR):
+        preview = None
+        if isinstance(txt, tuple):
+            txt, preview = txt
+        if txt.startswith(SERVER_DOMAIN + IMAGE_URL_PATH):
             messages.append({
                 'type': 'image',
                 'originalContentUrl': txt,
-                'previewImageUrl': txt
+                'previewImageUrl': preview_path(txt) # 縮小した画像
             })
         elif txt.startswith(SERVER_DOMAIN + VIDEO_DIR):
             messages.append({
                 'type': 'video',
                 'originalContentUrl': txt,
-                'previewImageUrl': SERVER_DOMAIN + IMAGE_DIR + 'board_start.png'
+                'previewImageUrl': preview if preview is not None else SERVER_DOMAIN + START_PREVIEW_PATH
             })
         else:
             messages.append({
@@ -113,40 +127,75 @@ def make_response(texts: List[str], receiver : str, is_push: bool = False) -> Tu
 
 # 敵の石の配置
 def act_enemy(board: Board, user_id: str) -> str:
-    act_alpha_beta(board) # αβ法
+    stats = ponderer.take(user_id, board) if ponderer is not None else None
+    if stats is not None:
+        # 先読みしておいた手を打つ
+        stats.log()
+        board.put_disc(*stats.move)
+    else:
+        stats = act_alpha_beta(board, SEARCH_TIME_LIMIT) # αβ法(反復深化)
     # board.put_max_pos() # 貪欲
     database.create(user_id, board.turn, board.current_color, board.to_bytes(), board.is_end())
-    messages = SERVER_DOMAIN + board.to_image(user_id)
+    messages = SERVER_DOMAIN + image_path(board, stats.move) # AIが打った手に印を付ける
     return messages
 
 
 # 盤面をリセットしてメッセージを生成
 def reset_board(req: Dict) -> List[str]:
+    if ponderer is not None:
+        ponderer.stop()
     database.update_end(req['source']['userId'])
     board = Board(None, None, None)
     database.create(req['source']['userId'], board.turn, board.current_color, board.to_bytes(), False)
     first_player = 'ボク(白)' if board.current_color == WHITE else 'あなた(黒)'
-    messages = [SERVER_DOMAIN + board.to_image(req['source']['userId']), 'リセットしたよ\n先攻は' + first_player + 'だよ']
+    messages = [SERVER_DOMAIN + image_path(board), 'リセットしたよ\n先攻は' + first_player + 'だよ']
     if board.current_color == WHITE:
         messages.append(act_enemy(board, req['source']['userId']))
     messages.append('次の手を指定してね')
+    if ponderer is not None:
+        ponderer.start(req['source']['userId'], board)
     return messages
 
 
 # 履歴を生成して盤面を生成
-def show_history(user_id: str) -> List[str]:
-    image_paths = []
+def show_history(user_id: str) -> List[Union[str, Tuple[str, str]]]:
+    boards = []
     board_history = database.read_all(user_id)
     if len(board_history) == 0:
         return ['対戦履歴がないよ']
     for bh in board_history:
-        board_reproduced = Board(bh[0], bh[1], bh[2])
-        image_paths.append(board_reproduced.to_image(user_id))
-    video_path = make_video(image_paths, user_id)
-    messages = [SERVER_DOMAIN + video_path, '対戦履歴だよ']
+        boards.append(Board(bh[0], bh[1], bh[2]))
+    if ponderer is not None:
+        ponderer.stop() # 動画を作る間は先読みを止める(同じワーカーでGILを取り合う)
+    video_path = make_video(boards, user_id)
+    if ponderer is not None:
+        turn, color, board = database.read(user_id)
+        if turn is not None:
+            ponderer.start(user_id, Board(turn, color, board)) # 対戦中でユーザの手番なら先読みをやり直す
+    messages = [(SERVER_DOMAIN + video_path, SERVER_DOMAIN + image_path(boards[-1], preview=True)), '対戦履歴だよ'] # プレビューは最後の盤面
     return messages
 
 
+# 今の盤面で良さそうな手を教える(盤面は進めない)
+def show_hint(user_id: str) -> List[str]:
+    turn, color, board = database.read(user_id)
+    if turn is None:
+        return ['対戦中の盤面がないよ\nリセットを入力して対戦を始めよう！']
+    board = Board(turn, color, board)
+    if board.is_end():
+        return ['対戦は終わっているよ\nもう一回プレイするには「リセット」を入力してね']
+    if board.current_color == WHITE:
+        return ['今はボクの番だよ']
+    if ponderer is not None:
+        ponderer.stop() # 先読みと同時に探索しないように止めておく
+    depth, ranking = analyze(board, HINT_MOVES, HINT_TIME_LIMIT, HINT_MAX_NODES)
+    if ponderer is not None:
+        ponderer.start(user_id, board)
+    lines = [f'{i + 1}. {chr(ord("a") + x - 1)}{y} (評価値{score:+d})' for i, ((x, y), score, _) in enumerate(ranking)]
+    logging.info(f'ヒント: {user_id} 深さ{depth} {ranking}')
+    return ['ボクならこう打つかな\n' + '\n'.join(lines)]
+
+
 # 対戦終了後の処理
 def finalize(board: Board, user_id: str) -> List[str]:
     messages = [board.judge_winner()]
@@ -157,9 +206,11 @@ def finalize(board: Board, user_id: str) -> List[str]:
 
 # 座標を取得して一手進める
 def move_forward(req: Dict) -> List[str]:
+    if ponderer is not None:
+        ponderer.stop() # 先読みと同時に探索しないように止めておく
     turn, color, board = database.read(req['source']['userId']) # ユーザの最後の履歴を読み込む
     board = Board(turn, color, board) # 履歴から盤面を構築（履歴がなければ初期盤面）
-    messages = [SERVER_DOMAIN + board.to_image(req['source']['userId'])]
+    messages = [SERVER_DOMAIN + image_path(board)]
     logging.debug(messages[-1])
     put_x, put_y = pos2xy(req['message']['text']) # 入力されたメッセージを座標に変換
 
@@ -167,7 +218,7 @@ def move_forward(req: Dict) -> List[str]:
         messages.append('xyで指定してね')
 
     elif board.put_disc(put_x, put_y):
-        messages = [SERVER_DOMAIN + board.to_image(req['source']['userId'])]
+        messages = [SERVER_DOMAIN + image_path(board)]
         database.create(req['source']['userId'], board.turn, board.current_color, board.to_bytes(), board.is_end())
         if board.is_end():
             messages += finalize(board, req['source']['userId'])
@@ -182,9 +233,28 @@ def move_forward(req: Dict) -> List[str]:
     else:
         messages.append('そこには置けないよ\nもう一度座標を指定してね')
 
+    if ponderer is not None:
+        ponderer.start(req['source']['userId'], board) # ユーザの手番なら先読みを始める
     return messages
 
 
+# 盤面の画像を返す(キーから盤面を戻して描き、PNGにしてメモリにキャッシュする)
+# 同じURLの画像は変わらないので、ブラウザやnginx・CDNにずっとキャッシュしてもらう
+@app.route(f'/{IMAGE_URL_PATH}v<int:version>/<key>.<format>', methods=['get'], defaults={'preview': False})
+@app.route(f'/{IMAGE_URL_PATH}v<int:version>/preview/<key>.<format>', methods=['get'], defaults={'preview': True})
+def board_image(version: int, key: str, format: str, preview: bool):
+    if version != RENDER_VERSION or format not in IMAGE_FORMATS:
+        abort(404)
+    try:
+        data = encoded_image_cache.get(key, format, preview)
+    except ValueError:
+        abort(404)
+    response = app.response_class(data, mimetype=IMAGE_FORMATS[format])
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    response.set_etag(f'v{version}-{"preview-" if preview else ""}{key}.{format}')
+    return response.make_conditional(request)
+
+
 # 「/」にPOSTリクエストが来た場合、index関数が実行される
 @app.route('/', methods=['post'])
 def index():
@@ -200,6 +270,8 @@ def index():
                 messages = reset_board(request_event)
             elif request_event['message']['text'] in HISTORY_WORDS:
                 messages = show_history(request_event['source']['userId'])
+            elif request_event['message']['text'] in HINT_WORDS:
+                messages = show_hint(request_event['source']['userId'])
             else:
                 messages = move_forward(request_event)
                 logging.debug(f'メッセージ：{messages}')
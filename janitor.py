@@ -0,0 +1,195 @@
+# 古い画像と動画を消す(掃除係)
+# IMAGE_DIR・VIDEO_DIRのファイルを少しずつ調べ、期限(ttl)を過ぎたものを消し、合計がmax_bytesを超えたら古いものから消す
+# LINEは送った後にURLから取りに来るので、min_ageより新しいファイルは容量を超えていても消さない
+# 1回に調べるのはbatch個までで、その間は休むので、リクエストの処理を止めない
+# gunicornのワーカーごとにスレッドを起動するが、ロックファイルを取れた1つのワーカーだけが掃除する(そのワーカーが終わったら他が引き継ぐ)
+# 一周するたびに統計をログとmetrics_pathのJSONに書く
+#
+# 使い方(一周だけ掃除する): python janitor.py
+
+from typing import Dict, List, Tuple, Union
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+
+from env import IMAGE_DIR, VIDEO_DIR
+from constant import RETENTION_TTL, RETENTION_MAX_BYTES, RETENTION_MIN_AGE, RETENTION_INTERVAL, RETENTION_SCAN_BATCH, RETENTION_BATCH_PAUSE, RETENTION_LOCK_PATH, RETENTION_METRICS_PATH
+
+
+JANITOR_LOG_PREFIX = '掃除の統計：' # ログからこの後ろのJSONを読み出す
+TARGET_EXTENSIONS = ('.png', '.webp', '.mp4') # 消してよいファイルの拡張子
+PROTECTED_FILES = ('board_template.png', 'board_start.png') # 消さないファイル
+
+
+class Janitor:
+    def __init__(self, directories: Union[List[str], None] = None, ttl: float = RETENTION_TTL, max_bytes: int = RETENTION_MAX_BYTES, min_age: float = RETENTION_MIN_AGE,
+                 interval: float = RETENTION_INTERVAL, batch: int = RETENTION_SCAN_BATCH, pause: float = RETENTION_BATCH_PAUSE,
+                 lock_path: str = RETENTION_LOCK_PATH, metrics_path: Union[str, None] = RETENTION_METRICS_PATH) -> None:
+        # IMAGE_DIRとVIDEO_DIRが同じなら同じファイルを2回数えないように、1つにまとめる
+        self.directories = []
+        for directory in directories if directories is not None else [IMAGE_DIR, VIDEO_DIR]:
+            if all(os.path.realpath(directory) != os.path.realpath(other) for other in self.directories):
+                self.directories.append(directory)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.min_age = min_age
+        self.interval = interval
+        self.batch = batch
+        self.pause = pause
+        self.lock_path = lock_path
+        self.metrics_path = metrics_path
+        self.lock_file = None
+        self.stop_event = threading.Event()
+        self.thread = None
+        # 統計
+        self.passes = 0
+        self.files = 0 # 前の一周で残ったファイル数
+        self.bytes = 0 # 前の一周で残ったバイト数
+        self.expired_files = 0 # 期限切れで消した数(起動してからの合計)
+        self.evicted_files = 0 # 容量を超えて消した数(起動してからの合計)
+        self.deleted_bytes = 0
+        self.errors = 0
+        self.over_budget = False # 消せるものを消しても容量を超えていた
+        self.last_pass_seconds = 0.0
+        self.last_pass_end = 0.0
+
+    def start(self) -> None:
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+    def stop(self) -> None:
+        self.stop_event.set()
+
+    # 掃除するのは1つのプロセスだけにする(取れなければFalse)
+    def acquire(self) -> bool:
+        if self.lock_file is None:
+            self.lock_file = open(self.lock_path, 'a')
+        try:
+            fcntl.flock(self.lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except OSError:
+            return False
+
+    def run(self) -> None:
+        while not self.stop_event.is_set():
+            try:
+                if self.acquire():
+                    self.clean()
+            except Exception:
+                self.errors += 1
+                logging.exception('画像と動画の掃除に失敗しました')
+            self.stop_event.wait(self.interval)
+
+    # 1周する。ファイルはbatch個ずつ調べ、その間はpause秒休む
+    def clean(self) -> None:
+        start = time.perf_counter()
+        now = time.time()
+        remaining: List[Tuple[float, int, str]] = [] # 残したファイルの(更新時刻, バイト数, パス)
+        scanned = 0
+        for directory in self.directories:
+            try:
+                entries = os.scandir(directory)
+            except OSError:
+                self.errors += 1
+                logging.exception(f'{directory}を読めませんでした')
+                continue
+            with entries:
+                for entry in entries:
+                    if self.stop_event.is_set():
+                        return
+                    scanned += 1
+                    if scanned % self.batch == 0:
+                        self.stop_event.wait(self.pause)
+                    if entry.name in PROTECTED_FILES or not entry.name.endswith(TARGET_EXTENSIONS):
+                        continue
+                    try:
+                        if not entry.is_file(follow_symlinks=False):
+                            continue
+                        stat = entry.stat(follow_symlinks=False)
+                    except OSError:
+                        continue # 調べている間に消された
+                    if now - stat.st_mtime > max(self.ttl, self.min_age):
+                        if self.delete(entry.path, stat.st_size):
+                            self.expired_files += 1
+                    else:
+                        remaining.append((stat.st_mtime, stat.st_size, entry.path))
+        # 容量を超えていたら古いものから消す
+        total = sum(size for _, size, _ in remaining)
+        remaining.sort()
+        deleted = 0
+        for mtime, size, path in remaining:
+            if total <= self.max_bytes or now - mtime < self.min_age:
+                break
+            if self.delete(path, size):
+                self.evicted_files += 1
+                total -= size
+                deleted += 1
+                if deleted % self.batch == 0:
+                    self.stop_event.wait(self.pause)
+        self.over_budget = total > self.max_bytes
+        if self.over_budget:
+            logging.warning(f'画像と動画が{total}バイトあり、上限の{self.max_bytes}バイトを超えています(新しいファイルは消していません)')
+        self.files = len(remaining) - deleted
+        self.bytes = total
+        self.passes += 1
+        self.last_pass_seconds = time.perf_counter() - start
+        self.last_pass_end = time.time()
+        self.write_metrics()
+
+    # 消せたか、もうなかったらTrue(どちらもファイルの分の容量は空いている)
+    def delete(self, path: str, size: int) -> bool:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            return True # 他で消された
+        except OSError:
+            self.errors += 1
+            logging.exception(f'{path}を消せませんでした')
+            return False
+        self.deleted_bytes += size
+        return True
+
+    def metrics(self) -> Dict:
+        return {
+            'pid': os.getpid(), 'passes': self.passes, 'files': self.files, 'bytes': self.bytes, 'max_bytes': self.max_bytes, 'over_budget': self.over_budget,
+            'expired_files': self.expired_files, 'evicted_files': self.evicted_files, 'deleted_bytes': self.deleted_bytes, 'errors': self.errors,
+            'last_pass_seconds': self.last_pass_seconds, 'last_pass_end': self.last_pass_end,
+        }
+
+    def write_metrics(self) -> None:
+        metrics = self.metrics()
+        logging.info(JANITOR_LOG_PREFIX + json.dumps(metrics))
+        if self.metrics_path is None:
+            return
+        # 読む側が書きかけのファイルを読まないように、別名で書いてから置き換える
+        tmp_path = f'{self.metrics_path}.{os.getpid()}'
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(metrics, f)
+            os.replace(tmp_path, self.metrics_path)
+        except OSError:
+            self.errors += 1
+            logging.exception(f'{self.metrics_path}に書き込めませんでした')
+
+
+# metrics_pathに書かれた最新の統計を読む(なければNone)
+def read_metrics(path: str = RETENTION_METRICS_PATH) -> Union[Dict, None]:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+if __name__ == '__main__':
+    janitor = Janitor(metrics_path=None)
+    if not janitor.acquire():
+        print('他のプロセスが掃除しています')
+        print(json.dumps(read_metrics(), ensure_ascii=False, indent=1))
+    else:
+        janitor.clean()
+        print(json.dumps(janitor.metrics(), ensure_ascii=False, indent=1))
@@ -14,4 +14,4 @@ board.board = np.array([[2, 2, 2, 2, 2, 2, 2, 2, 2, 2],
     [2,  0, -1,  1,  1,  1, -1,  0,  0, 2],
     [2, 2, 2, 2, 2, 2, 2, 2, 2, 2]
 ], dtype=np.int8).T
-board.to_image('a')
\ No newline at end of file
+board.to_image()
\ No newline at end of file
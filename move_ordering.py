@@ -0,0 +1,71 @@
+# 探索で手を調べる順番を決める
+# 良い手から調べるほどαβ法の枝刈りが早く起こる
+# 置換表の最善手 → キラー手(同じ深さでカットを起こした手) → ヒストリー(カットを起こした回数)と静的な見積もり の順
+
+from typing import List, Tuple
+
+from bitboard import get_flips, xy2sq
+from board import Board
+from constant import BOARD_SIZE, MAX_SEARCH_DEPTH
+from transposition import NO_MOVE
+
+
+KILLER_NUM = 2 # 1つの深さで覚えておくキラー手の数
+
+# マスごとの事前の見積もり(隅は良く、隅の斜め隣(X打ち)と隣(C打ち)は悪い)
+SQUARE_PRIOR = [
+    40, -10,  4,  2,  2,  4, -10,  40,
+   -10, -20, -2, -2, -2, -2, -20, -10,
+     4,  -2,  2,  1,  1,  2,  -2,   4,
+     2,  -2,  1,  0,  0,  1,  -2,   2,
+     2,  -2,  1,  0,  0,  1,  -2,   2,
+     4,  -2,  2,  1,  1,  2,  -2,   4,
+   -10, -20, -2, -2, -2, -2, -20, -10,
+    40, -10,  4,  2,  2,  4, -10,  40,
+]
+
+
+class MoveOrdering:
+    def __init__(self) -> None:
+        self.killers = [[NO_MOVE] * KILLER_NUM for _ in range(MAX_SEARCH_DEPTH + 2)]
+        self.history = [0] * (BOARD_SIZE * BOARD_SIZE)
+        # 枝刈りの効き具合(1手目でカットできた割合が高いほど並べ方が良い)
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+
+    # 次の探索を始めるときに呼ぶ(キラー手は捨て、ヒストリーは半分にして残す)
+    def new_search(self) -> None:
+        self.killers = [[NO_MOVE] * KILLER_NUM for _ in range(MAX_SEARCH_DEPTH + 2)]
+        self.history = [h // 2 for h in self.history]
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+
+    # 手を調べる順に並べ替える
+    def order(self, board: Board, moves: List[Tuple[int, int]], ply: int, tt_move: int = NO_MOVE) -> List[Tuple[int, int]]:
+        killers = self.killers[ply]
+        # 盤面の配列(BitBoard.movable_cnt)は作らず、ビット列から手ごとに数える
+        player, opponent = board.players(board.current_color)
+        def priority(move: Tuple[int, int]) -> int:
+            sq = xy2sq(*move)
+            if sq == tt_move:
+                return 1 << 30
+            if sq in killers:
+                return (1 << 29) - killers.index(sq)
+            # 裏返す石が少ない手ほど相手に手を与えにくい
+            return self.history[sq] + SQUARE_PRIOR[sq] - get_flips(player, opponent, sq).bit_count()
+        return sorted(moves, key=priority, reverse=True)
+
+    # moveでカットが起きたときに呼ぶ(indexは何手目に調べた手か)
+    def update(self, move: Tuple[int, int], ply: int, depth: int, index: int) -> None:
+        sq = xy2sq(*move)
+        self.cutoffs += 1
+        if index == 0:
+            self.first_move_cutoffs += 1
+        killers = self.killers[ply]
+        if sq != killers[0]:
+            killers.insert(0, sq)
+            killers.pop()
+        self.history[sq] += depth * depth
+
+    def first_move_cutoff_rate(self) -> float:
+        return self.first_move_cutoffs / self.cutoffs if self.cutoffs > 0 else 0.0
@@ -0,0 +1,139 @@
+# 定石(序盤の最善手)の本
+# 初期局面から決まった手数までの全局面をあらかじめ探索して、局面 → 最善手・評価値 をファイルに保存する
+# 局面は対称なもの(回転・反転)をまとめた標準形で持ち、最善手も標準形の向きで保存する
+# ファイルは局面の順に並べた固定長のレコードなので、mmapしたまま二分探索で引ける(ワーカー間でページキャッシュを共有できる)
+#
+# 作り方: python opening_book.py --ply 6 --depth 8 --output opening_book.bin
+
+from typing import Dict, Tuple, Union
+import argparse
+import mmap
+import os
+import struct
+import time
+
+from bitboard import BitBoard, xy2sq, sq2xy
+from board import Board
+from constant import WHITE, BLACK, OPENING_BOOK_PATH
+from move_ordering import MoveOrdering
+from symmetry import canonicalize, SQUARE_MAP, INVERSE_SQUARE_MAP
+from transposition import TranspositionTable
+
+
+MAGIC = b'OBK1'
+VERSION = 2
+HEADER = struct.Struct('<4sII') # マジックナンバー, バージョン, レコード数
+RECORD = struct.Struct('<QQbhB') # 手番側の石, 相手側の石, 最善手のマス番号, 評価値, 探索した深さ
+
+
+# 手番側から見た局面の標準形(白番の局面と黒番の局面を同じように扱う)と変換の番号
+def book_key(board: Board) -> Tuple[int, int, int]:
+    black, white = board.to_bits()
+    player, opponent = (white, black) if board.current_color == WHITE else (black, white)
+    return canonicalize(player, opponent)
+
+
+class OpeningBook:
+    def __init__(self, path: str) -> None:
+        self.file = open(path, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.size = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'{path} is not an opening book of version {VERSION}')
+
+    def __len__(self) -> int:
+        return self.size
+
+    def record(self, i: int) -> tuple:
+        return RECORD.unpack_from(self.data, HEADER.size + i * RECORD.size)
+
+    # (最善手の座標, 評価値, 深さ)を返す。本になければNone
+    def lookup(self, board: Board) -> Union[Tuple[Tuple[int, int], int, int], None]:
+        player, opponent, sym = book_key(board)
+        key = (player, opponent)
+        low, high = 0, self.size
+        while low < high:
+            mid = (low + high) // 2
+            player, opponent, sq, score, depth = self.record(mid)
+            if (player, opponent) < key:
+                low = mid + 1
+            elif (player, opponent) > key:
+                high = mid
+            else:
+                return sq2xy(INVERSE_SQUARE_MAP[sym][sq]), score, depth
+        return None
+
+    def close(self) -> None:
+        self.data.close()
+        self.file.close()
+
+
+# 本のファイルがあれば開く
+def load_opening_book(path: str = OPENING_BOOK_PATH) -> Union[OpeningBook, None]:
+    if not os.path.exists(path):
+        return None
+    return OpeningBook(path)
+
+
+def write_book(path: str, entries: Dict[Tuple[int, int], Tuple[int, int, int]]) -> None:
+    # 一時ファイルに書いてから置き換える(読んでいるワーカーが壊れたファイルを見ないように)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(entries)))
+        for (player, opponent), (sq, score, depth) in sorted(entries.items()):
+            f.write(RECORD.pack(player, opponent, sq, score, depth))
+    os.replace(tmp_path, path)
+
+
+# 初期局面(先手は白・黒のどちらもありうる)からmax_ply手までの局面を全部探索する
+def build_book(max_ply: int, depth: int) -> Dict[Tuple[int, int], Tuple[int, int, int]]:
+    from alpha_beta import Search # alpha_betaは本を読み込むので、循環しないようにここで読む
+
+    positions = {}
+    def collect(board: Board, ply: int) -> None:
+        player, opponent, sym = book_key(board)
+        key = (player, opponent)
+        if key in positions or board.is_end():
+            return
+        positions[key] = (board.turn, board.current_color, board.to_bytes(), sym)
+        if ply >= max_ply:
+            return
+        for x, y in board.legal_moves():
+            board.make_move(x, y)
+            if not board.is_end() and not board.legal_moves():
+                board.make_pass()
+                collect(board, ply + 1)
+                board.undo_move()
+            else:
+                collect(board, ply + 1)
+            board.undo_move()
+
+    for color in (WHITE, BLACK):
+        board = BitBoard()
+        board.current_color = color
+        board.init_movable()
+        collect(board, 0)
+
+    search = Search(TranspositionTable(), MoveOrdering())
+    entries = {}
+    start = time.perf_counter()
+    for i, (key, (turn, color, data, sym)) in enumerate(positions.items()):
+        board = BitBoard(turn, color, data)
+        for d in range(1, depth + 1):
+            score, pv = search.search(board, d)
+        entries[key] = (SQUARE_MAP[sym][xy2sq(*pv[0])], score, depth)
+        if (i + 1) % 100 == 0:
+            print(f'{i + 1}/{len(positions)} {time.perf_counter() - start:.1f}s')
+    return entries
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='定石の本を作る')
+    parser.add_argument('--ply', type=int, default=4, help='初期局面から何手目の局面まで本に入れるか')
+    parser.add_argument('--depth', type=int, default=6, help='各局面を探索する深さ')
+    parser.add_argument('--output', default=OPENING_BOOK_PATH)
+    args = parser.parse_args()
+
+    entries = build_book(args.ply, args.depth)
+    write_book(args.output, entries)
+    print(f'{len(entries)}局面を{args.output}に書き込みました')
@@ -0,0 +1,181 @@
+# パターンによる評価関数
+# 辺・隅の3x3・隅の2x5・斜めの列をそれぞれ3進数(空き: 0, 黒: 1, 白: 2)の番号にして、パターンごとの重みの表を引く
+# 対称な位置にあるパターンは同じ表を使う
+# 探索中は打った石と裏返った石のマスの番号だけを更新するので、局面ごとに盤面全体を見直さない
+#
+# 重みは黒から見た値で、白黒を入れ替えた番号の重みは符号が逆になっているものとする
+# 重みのファイルがなければマスごとの重み(evaluation.BOARD_POINT)から作った重みを使う
+
+from typing import Dict, List, Sequence, Tuple
+import os
+import struct
+import numpy as np
+
+from bitboard import iter_bits
+from board import Board
+from constant import BLACK, PATTERN_WEIGHTS_PATH
+from evaluation import WEIGHTS
+from symmetry import SQUARE_MAP, TRANSFORM_NUM
+
+
+MAGIC = b'PAT1'
+HEADER = struct.Struct('<4sI') # マジックナンバー, パターンの種類の数
+
+# パターンの種類ごとの基本形のマス(マス番号 = y * 8 + x、左上の隅から見た並び)
+BASE_PATTERNS = [
+    ('edge', [x for x in range(8)]),
+    ('corner3x3', [y * 8 + x for y in range(3) for x in range(3)]),
+    ('corner2x5', [y * 8 + x for y in range(2) for x in range(5)]),
+    ('diagonal8', [i * 8 + i for i in range(8)]),
+    ('diagonal7', [i * 8 + i + 1 for i in range(7)]),
+    ('diagonal6', [i * 8 + i + 2 for i in range(6)]),
+    ('diagonal5', [i * 8 + i + 3 for i in range(5)]),
+    ('diagonal4', [i * 8 + i + 4 for i in range(4)]),
+]
+
+
+# 基本形を8通りに変換して、盤面上のパターンを全部並べる(同じマスの組は1つにまとめる)
+def make_instances() -> List[Tuple[int, List[int]]]:
+    instances = []
+    seen = set()
+    for kind, (_, squares) in enumerate(BASE_PATTERNS):
+        for t in range(TRANSFORM_NUM):
+            mapped = [SQUARE_MAP[t][sq] for sq in squares]
+            if frozenset(mapped) not in seen:
+                seen.add(frozenset(mapped))
+                instances.append((kind, mapped))
+    return instances
+
+
+INSTANCES = make_instances()
+
+# マスごとに、そのマスを含むパターンの番号と、そのマスの桁の重み(3のべき乗)
+SQUARE_INSTANCES = [[] for _ in range(64)]
+for i, (_, squares) in enumerate(INSTANCES):
+    for digit, sq in enumerate(squares):
+        SQUARE_INSTANCES[sq].append((i, 3 ** digit))
+
+
+# マスごとの重みを、そのマスを含むパターンの数で割って配った重み
+def default_weights() -> List[np.ndarray]:
+    cover = [len(instances) for instances in SQUARE_INSTANCES]
+    weights = []
+    for _, squares in BASE_PATTERNS:
+        table = np.zeros(3 ** len(squares), dtype=np.float64)
+        index = np.arange(3 ** len(squares))
+        for digit, sq in enumerate(squares):
+            state = index // 3 ** digit % 3
+            point = WEIGHTS[sq] / cover[sq]
+            table += np.where(state == 1, point, np.where(state == 2, -point, 0))
+        weights.append(np.round(table).astype(np.int16))
+    return weights
+
+
+def load_weights(path: str) -> List[np.ndarray]:
+    with open(path, 'rb') as f:
+        magic, kinds = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC or kinds != len(BASE_PATTERNS):
+            raise ValueError(f'{path} is not a pattern weight file')
+        return [np.fromfile(f, dtype='<i2', count=3 ** len(squares)) for _, squares in BASE_PATTERNS]
+
+
+def save_weights(path: str, weights: Sequence[np.ndarray]) -> None:
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, len(BASE_PATTERNS)))
+        for table in weights:
+            f.write(np.asarray(table, dtype='<i2').tobytes())
+
+
+# 黒・白のビット列からパターンの番号を全部求める
+def compute_indices(black: int, white: int) -> List[int]:
+    indices = [0] * len(INSTANCES)
+    for bits, state in ((black, 1), (white, 2)):
+        for sq in iter_bits(bits):
+            for i, power in SQUARE_INSTANCES[sq]:
+                indices[i] += state * power
+    return indices
+
+
+# 盤面が(black, white)から(new_black, new_white)に変わったときの、パターンごとの番号の増減
+def index_deltas(black: int, white: int, new_black: int, new_white: int) -> Dict[int, int]:
+    deltas = {}
+    for sq in iter_bits((black ^ new_black) | (white ^ new_white)):
+        state = (new_black >> sq & 1) + 2 * (new_white >> sq & 1) - (black >> sq & 1) - 2 * (white >> sq & 1)
+        for i, power in SQUARE_INSTANCES[sq]:
+            deltas[i] = deltas.get(i, 0) + state * power
+    return deltas
+
+
+# 重みのファイル → パターンごとの重みの表(読むだけなので、評価関数のオブジェクトの間で共有する)
+weight_tables: Dict[str, List[list]] = {}
+
+
+def load_tables(path: str) -> List[list]:
+    if path not in weight_tables:
+        weights = load_weights(path) if os.path.exists(path) else default_weights()
+        # 探索中はPythonのリストで引いた方が速い
+        tables = [table.tolist() for table in weights]
+        weight_tables[path] = [tables[kind] for kind, _ in INSTANCES]
+    return weight_tables[path]
+
+
+# 探索中の局面の状態を持つので、同時に動く探索どうしで同じオブジェクトを使わない
+class PatternEvaluator:
+    name = 'pattern'
+
+    def __init__(self, path: str = PATTERN_WEIGHTS_PATH) -> None:
+        self.tables = load_tables(path)
+        self.black = self.white = -1
+        self.indices = []
+        self.score = 0 # 黒から見た評価値
+        self.stack = []
+
+    # 探索を始める局面を設定する
+    def reset(self, board: Board) -> None:
+        self.black, self.white = board.to_bits()
+        self.indices = compute_indices(self.black, self.white)
+        self.score = sum(table[index] for table, index in zip(self.tables, self.indices))
+        self.stack = []
+
+    # 盤面に打った直後に呼ぶ
+    # 戻すときのために、変わったパターンの(番号, 前の値)だけを積んでおく
+    def make_move(self, board: Board) -> None:
+        black, white = board.to_bits()
+        tables, indices = self.tables, self.indices
+        changed = []
+        score = self.score
+        for i, delta in index_deltas(self.black, self.white, black, white).items():
+            old = indices[i]
+            changed.append((i, old))
+            score += tables[i][old + delta] - tables[i][old]
+            indices[i] = old + delta
+        self.stack.append((changed, self.score, self.black, self.white))
+        self.score = score
+        self.black, self.white = black, white
+
+    # 盤面を戻す直前に呼ぶ
+    def undo_move(self) -> None:
+        changed, self.score, self.black, self.white = self.stack.pop()
+        indices = self.indices
+        for i, old in changed:
+            indices[i] = old
+
+    def evaluate(self, board: Board) -> int:
+        if board.to_bits() != (self.black, self.white):
+            self.reset(board)
+        return self.score if board.current_color == BLACK else -self.score
+
+    # boardに打った子の局面(子の手番側, 子の相手側)の評価値を、子の手番側から見た値で返す
+    def evaluate_children(self, board: Board, children: Sequence[Tuple[int, int]]) -> List[int]:
+        if board.to_bits() != (self.black, self.white):
+            self.reset(board)
+        tables, indices = self.tables, self.indices
+        scores = []
+        for player, opponent in children:
+            # 子の手番はboardの手番の相手
+            black, white = (player, opponent) if board.current_color != BLACK else (opponent, player)
+            score = self.score
+            for i, delta in index_deltas(self.black, self.white, black, white).items():
+                score += tables[i][indices[i] + delta] - tables[i][indices[i]]
+            scores.append(score if board.current_color != BLACK else -score)
+        return scores
@@ -0,0 +1,135 @@
+# 合法手生成の正しさと速さを調べる(perft)
+# 決まった局面から深さNまでの全ての手順をたどり、末端の局面数を期待値と比べて、1秒あたりの局面数も表示する
+# 期待値は初期局面だけが公開されている値で、それ以外の局面はこのリポジトリの盤面クラスで数えて記録した値(回帰テスト用)
+# パスも1手として数え、途中で終局した局面はその時点で末端として数える
+# Boardと同じ使い方ができる盤面クラスなら何でも調べられるので、別実装の盤面の正しさと速さを比べられる
+#
+# 使い方: python perft.py --depth 6 --engine board:Board --engine bitboard:BitBoard
+#
+# make_move / make_pass / undo_move を持つ盤面は打って戻しながら調べる(make)
+# 持たない盤面(元のBoardと同じput_discだけの盤面)は局面をコピーしてput_discで調べる(copy)
+
+from typing import List, Tuple
+import argparse
+import importlib
+import sys
+import time
+
+import numpy as np
+
+from board import Board, bits2array
+from constant import WHITE, BLACK
+
+
+# 初期局面の公開されている値(深さ → 末端の局面数)
+START_COUNTS = {1: 4, 2: 12, 3: 56, 4: 244, 5: 1396, 6: 8200, 7: 55092, 8: 390216, 9: 3005288, 10: 24571284}
+
+# 保存しておいた局面(名前, 黒, 白, 手番, 深さ → 末端の局面数)
+# 途中でパスや終局が起こる局面を含む
+# 値は公開されているものではなく、このリポジトリの盤面クラスで数えて記録した回帰テスト用の値
+# Board・BitBoard(make / copyの両方)と、浅い深さでは元の(put_discだけの)Boardで一致を確かめただけなので、
+# どの盤面クラスにもある間違いは見つけられない(変更で数が変わったことだけが分かる)
+POSITIONS = [
+    ('mid40', 0x0000321a003c0000, 0x000505253f010000, BLACK, {1: 10, 2: 129, 3: 1253, 4: 16542, 5: 170099}),
+    ('mid30', 0x0000341c0c060201, 0x0e07032333394804, BLACK, {1: 9, 2: 78, 3: 750, 4: 7862, 5: 78046}),
+    ('pass', 0x40305a7730f8fc06, 0x08080088cf070371, WHITE, {1: 10, 2: 52, 3: 498, 4: 2620, 5: 22382, 6: 115547}),
+    ('end', 0x400003874f570f0f, 0xb8fcfc7830a8f020, WHITE, {1: 2, 2: 9, 3: 19, 4: 79, 5: 172, 6: 518, 7: 920}),
+]
+
+
+def start_position() -> Tuple[int, int]:
+    return Board(0, BLACK, Board().to_bytes()).to_bits()
+
+
+# 黒・白のビット列と手番から盤面を作る
+def make_board(engine: type, black: int, white: int, color: int) -> Board:
+    turn = black.bit_count() + white.bit_count() - 4
+    return engine(turn, color, bits2array(black, white).tobytes())
+
+
+def perft(board: Board, depth: int) -> int:
+    if depth == 0:
+        return 1
+    moves = board.legal_moves()
+    if not moves:
+        if board.is_end():
+            return 1
+        board.make_pass()
+        count = perft(board, depth - 1)
+        board.undo_move()
+        return count
+    if depth == 1:
+        return len(moves)
+    count = 0
+    for x, y in moves:
+        board.make_move(x, y)
+        count += perft(board, depth - 1)
+        board.undo_move()
+    return count
+
+
+# put_discは相手が打てないと自動でパスするので、手番が変わらなかったらパスを1手として数える
+def perft_copy(board: Board, depth: int) -> int:
+    if depth == 0:
+        return 1
+    moves = list(zip(*np.nonzero(board.movable_pos)))
+    if not moves:
+        if board.is_end():
+            return 1
+        return perft_copy(type(board)(board.turn, -board.current_color, board.to_bytes()), depth - 1)
+    count = 0
+    for x, y in moves:
+        child = type(board)(board.turn, board.current_color, board.to_bytes())
+        child.put_disc(x, y)
+        if depth == 1 or child.is_end():
+            count += 1
+        elif child.current_color == board.current_color:
+            count += 1 if depth == 2 else perft_copy(child, depth - 2)
+        else:
+            count += perft_copy(child, depth - 1)
+    return count
+
+
+# 'モジュール名:クラス名'から盤面クラスを読み込む
+def load_engine(spec: str) -> type:
+    module, name = spec.split(':')
+    return getattr(importlib.import_module(module), name)
+
+
+# 局面ごとに深さ1からmax_depthまで調べ、(名前, 深さ, 局面数, 期待値, 秒)のリストを返す
+def run(engine: type, max_depth: int, mode: str = 'auto') -> List[Tuple[str, int, int, int, float]]:
+    if mode == 'auto':
+        mode = 'make' if hasattr(engine, 'make_move') else 'copy'
+    count_func = perft if mode == 'make' else perft_copy
+    black, white = start_position()
+    positions = [('start', black, white, BLACK, START_COUNTS)] + POSITIONS
+    results = []
+    for name, black, white, color, counts in positions:
+        for depth in sorted(counts):
+            if depth > max_depth:
+                break
+            board = make_board(engine, black, white, color)
+            start = time.perf_counter()
+            count = count_func(board, depth)
+            results.append((name, depth, count, counts[depth], time.perf_counter() - start))
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='盤面クラスの合法手生成を調べる')
+    parser.add_argument('--depth', type=int, default=6, help='調べる最大の深さ')
+    parser.add_argument('--engine', action='append', help='盤面クラス(モジュール名:クラス名)。複数指定できる')
+    parser.add_argument('--mode', choices=['auto', 'make', 'copy'], default='auto', help='make: 打って戻す / copy: コピーしてput_disc')
+    args = parser.parse_args()
+
+    failed = False
+    for spec in args.engine or ['board:Board', 'bitboard:BitBoard']:
+        total_count, total_time = 0, 0.0
+        for name, depth, count, expected, elapsed in run(load_engine(spec), args.depth, args.mode):
+            ok = count == expected
+            failed |= not ok
+            total_count += count
+            total_time += elapsed
+            print(f'{spec:20} {name:10} 深さ{depth:2} {count:10} {"OK" if ok else f"NG(期待値は{expected})"} {elapsed:8.3f}秒 {count / elapsed if elapsed > 0 else 0:10.0f}局面/秒')
+        print(f'{spec:20} 合計 {total_count}局面 {total_time:.3f}秒 {total_count / total_time if total_time > 0 else 0:.0f}局面/秒')
+    sys.exit(1 if failed else 0)
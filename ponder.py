@@ -0,0 +1,141 @@
+# 先読み(ponder)
+# AIが返信してからユーザの次のメッセージが来るまでの間に、別スレッドでユーザが打ちそうな手ごとにAIの手を探索しておく
+# 結果はユーザごとにまとめて覚えておき(期限と局面数の上限つき)、実際にその局面になったら探索せずに使う
+# 置換表と手の並べ替えの情報は本番の探索と共有するので、先読みと本番の探索が同時に動かないようにする
+#
+# 先読みはワーカーの中のスレッドで動くので、同じワーカーのリクエストの処理(画像を返すのも含む)とGILを取り合う
+# 探索と動画の作成の前には止めるが、画像を返す間は止めない(LINEは返信の直後に画像を取りに来るので、止めると先読みできない)
+# 結果はワーカーごとに持つので、ユーザの次のメッセージが別のワーカーに来ると使えない
+# 深さANALYSIS_CACHE_MIN_DEPTH以上読めた結果は解析キャッシュ(SQLite)にも書くので、別のワーカーでもそこから使える
+# それ以外の効果があるのはワーカーが1つのときだけ
+
+from collections import OrderedDict
+from typing import Dict, Tuple, Union
+import logging
+import queue
+import threading
+import time
+
+from alpha_beta import act_alpha_beta, move_ordering
+from board import Board
+from constant import WHITE, PONDER_TIME_LIMIT, PONDER_EXPIRE, PONDER_CACHE_SIZE
+from search_stats import SearchStats
+
+
+class Ponderer:
+    def __init__(self, time_limit: float = PONDER_TIME_LIMIT, expire: float = PONDER_EXPIRE, cache_size: int = PONDER_CACHE_SIZE, ai_color: int = WHITE) -> None:
+        self.time_limit = time_limit
+        self.expire = expire
+        self.cache_size = cache_size
+        self.ai_color = ai_color
+        # ユーザID → {(盤面, 手番): (探索の統計, 期限)}。古く使われたユーザから捨てる
+        self.cache: 'OrderedDict[str, Dict[Tuple[bytes, int], Tuple[SearchStats, float]]]' = OrderedDict()
+        self.cache_num = 0
+        self.cache_lock = threading.Lock()
+        self.jobs = queue.Queue()
+        self.stop_event = threading.Event()
+        self.search_lock = threading.Lock() # 先読みの探索中は持っておく
+        self.generation = 0 # stopするたびに増やし、それより前に頼まれた先読みは行わない
+        self.thread = None
+        # 効き具合
+        self.hits = 0
+        self.misses = 0
+
+    # ユーザの手番になったboardから先読みを始める
+    def start(self, user_id: str, board: Board) -> None:
+        if board.is_end() or board.current_color == self.ai_color:
+            return
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+        self.jobs.put((self.generation, user_id, type(board), board.turn, board.current_color, board.to_bytes()))
+
+    # 先読みを止めて、探索が終わるまで待つ(本番の探索の前に呼ぶ)
+    def stop(self) -> None:
+        self.stop_event.set()
+        while True:
+            try:
+                self.jobs.get_nowait()
+            except queue.Empty:
+                break
+        with self.search_lock:
+            self.generation += 1
+            self.stop_event.clear()
+
+    # AIの手番のboardについて先読みの結果があれば取り出す(使ったユーザの結果は全部捨てる)
+    def take(self, user_id: str, board: Board) -> Union[SearchStats, None]:
+        with self.cache_lock:
+            entries = self.cache.pop(user_id, {})
+            self.cache_num -= len(entries)
+        entry = entries.get((board.to_bytes(), board.current_color))
+        if entry is None or entry[1] < time.time() or not board.movable_pos[entry[0].move]:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry[0]
+
+    def hit_rate(self) -> float:
+        return self.hits / (self.hits + self.misses) if self.hits + self.misses > 0 else 0.0
+
+    def store(self, user_id: str, key: Tuple[bytes, int], stats: SearchStats) -> None:
+        with self.cache_lock:
+            entries = self.cache.setdefault(user_id, {})
+            self.cache.move_to_end(user_id)
+            if key not in entries:
+                self.cache_num += 1
+            entries[key] = (stats, time.time() + self.expire)
+            # 上限を超えたら古いユーザの結果から捨てる
+            while self.cache_num > self.cache_size and len(self.cache) > 1:
+                _, old = self.cache.popitem(last=False)
+                self.cache_num -= len(old)
+
+    def cached(self, user_id: str, key: Tuple[bytes, int]) -> bool:
+        with self.cache_lock:
+            return key in self.cache.get(user_id, {})
+
+    # 期限切れの結果を捨てる
+    def purge(self) -> None:
+        now = time.time()
+        with self.cache_lock:
+            for user_id in list(self.cache):
+                entries = self.cache[user_id]
+                for key in [key for key, (_, expires) in entries.items() if expires < now]:
+                    del entries[key]
+                    self.cache_num -= 1
+                if not entries:
+                    del self.cache[user_id]
+
+    def run(self) -> None:
+        while True:
+            job = self.jobs.get()
+            with self.search_lock:
+                if job[0] != self.generation:
+                    continue
+                try:
+                    self.ponder(*job[1:])
+                except Exception:
+                    logging.exception('先読みに失敗しました')
+
+    # ユーザの手を打ちそうな順に1つずつ試し、その後のAIの手を探索する
+    def ponder(self, user_id: str, board_class: type, turn: int, color: int, data: bytes) -> None:
+        self.purge()
+        board = board_class(turn, color, data)
+        replies = move_ordering.order(board, board.legal_moves(), 0)
+        for x, y in replies:
+            if self.stop_event.is_set():
+                return
+            child = board_class(turn, color, data)
+            child.put_disc(x, y)
+            # AIがパスするときはユーザがもう一度打つので先読みしない
+            if child.is_end() or child.current_color != self.ai_color:
+                continue
+            key = (child.to_bytes(), child.current_color)
+            if self.cached(user_id, key):
+                continue
+            stats = act_alpha_beta(child, self.time_limit, workers=1, stop=self.stop_event, log=False)
+            if self.stop_event.is_set():
+                return
+            stats.pondered = True
+            self.store(user_id, key, stats)
+        logging.debug(f'先読みが終わりました：{user_id}　{len(replies)}手')
+
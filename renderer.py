@@ -0,0 +1,172 @@
+# 盤面の画像を作る
+# 盤面のテンプレート画像はプロセスごとに1回だけ読み込み、石や印は1マス分の画像(タイル)を先に作っておく
+# 画像は使い回すバッファにテンプレートをコピーし、石のあるマスにタイルを貼り付けて作る
+# 画像に使う色はテンプレートとタイルの色だけなので、色の番号の画像も同じように作り、8ビットのパレットPNGにできる
+#
+# 画像の形式
+#   png  : 8ビットのパレットPNG(色が256より多いテンプレートならフルカラーのPNG)
+#   webp : 可逆のWebP(LINEは受け付けないので、LINEに送る画像には使わない)
+# プレビュー(LINEのpreviewImageUrl)は縮小した画像で、pngなら縮小で混ざった色をパレットの一番近い色にする
+
+from typing import Dict, Tuple, Union
+import logging
+import struct
+import threading
+import zlib
+
+import numpy as np
+import cv2
+
+from board import Board
+from env import IMAGE_DIR
+from constant import BOARD_SIZE, EMPTY, WHITE, BLACK, IMAGE_FORMAT, IMAGE_PNG_COMPRESSION, IMAGE_PREVIEW_SIZE
+
+
+CELL_SIZE = 50 # 1マスの大きさ(ピクセル)
+BOARD_OFFSET = 50 # 盤面の左上の位置(座標の文字の分だけずれている)
+DISC_RADIUS = 20 # 石の半径
+TILE_SIZE = DISC_RADIUS * 2 + 1 # タイルの大きさ(マスの線にかからない)
+MARKER_RADIUS = 5 # 最後に打った手と合法手の印の半径
+DISC_COLORS = {BLACK: (0, 0, 0), WHITE: (255, 255, 255)} # 石の色(BGR)
+LAST_MOVE_COLOR = (0, 0, 255) # 最後に打った手の印の色
+LEGAL_MOVE_COLOR = (160, 160, 160) # 合法手の印の色
+IMAGE_FORMATS = {'png': 'image/png', 'webp': 'image/webp'} # 画像の形式 → MIMEタイプ
+WEBP_LOSSLESS = 101 # IMWRITE_WEBP_QUALITYを100より大きくすると可逆になる
+LUT_BITS = 5 # 色をパレットの番号にする表の1色あたりのビット数
+
+
+# BGRの画像を色(24ビットの整数)の配列にする
+def pack_colors(img: np.ndarray) -> np.ndarray:
+    img = img.astype(np.uint32)
+    return (img[..., 0] << 16) | (img[..., 1] << 8) | img[..., 2]
+
+
+def png_chunk(kind: bytes, data: bytes) -> bytes:
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+
+# 色の番号の画像とパレット(BGR)から8ビットのパレットPNGを作る
+# パレットの画像はフィルタをかけない方が小さくなるので、各行のフィルタは0(なし)にする
+def encode_palette_png(indices: np.ndarray, palette: np.ndarray, level: int = IMAGE_PNG_COMPRESSION) -> bytes:
+    height, width = indices.shape
+    raw = np.zeros((height, width + 1), dtype=np.uint8)
+    raw[:, 1:] = indices
+    header = struct.pack('>IIBBBBB', width, height, 8, 3, 0, 0, 0)
+    return (b'\x89PNG\r\n\x1a\n' + png_chunk(b'IHDR', header) + png_chunk(b'PLTE', palette[:, ::-1].tobytes())
+        + png_chunk(b'IDAT', zlib.compress(raw.tobytes(), level)) + png_chunk(b'IEND', b''))
+
+
+class BoardRenderer:
+    def __init__(self, template_path: str = IMAGE_DIR + 'board_template.png') -> None:
+        self.template = cv2.imread(template_path)
+        if self.template is None:
+            raise FileNotFoundError(template_path)
+        self.buffer = np.empty_like(self.template)
+        self.lock = threading.Lock() # バッファを使い回すので、書き出し終わるまで他から描かない
+        # 1つのマスの中身(線を含まない)を背景にしてタイルを作る
+        left = BOARD_OFFSET + CELL_SIZE // 2 - DISC_RADIUS
+        background = self.template[left : left + TILE_SIZE, left : left + TILE_SIZE]
+        self.tiles = {}
+        for color in (BLACK, WHITE):
+            self.tiles[color, False] = self.make_tile(background, DISC_COLORS[color], None)
+            self.tiles[color, True] = self.make_tile(background, DISC_COLORS[color], LAST_MOVE_COLOR)
+        self.tiles[EMPTY, True] = self.make_tile(background, None, LEGAL_MOVE_COLOR)
+        # パレットと色の番号のテンプレート・タイル(色が多すぎたらパレットPNGは使わない)
+        colors = np.unique(np.concatenate([pack_colors(self.template).ravel()] + [pack_colors(tile).ravel() for tile in self.tiles.values()]))
+        if len(colors) <= 256:
+            self.palette = np.stack([(colors >> 16) & 0xff, (colors >> 8) & 0xff, colors & 0xff], axis=1).astype(np.uint8)
+            self.index_template = np.searchsorted(colors, pack_colors(self.template)).astype(np.uint8)
+            self.index_tiles = {state: np.searchsorted(colors, pack_colors(tile)).astype(np.uint8) for state, tile in self.tiles.items()}
+            self.index_buffer = np.empty_like(self.index_template)
+            self.lut = self.make_lut() # 色 → 一番近いパレットの番号(プレビュー用。作るのに0.3秒くらいかかるので最初に作る)
+        else:
+            logging.warning(f'{template_path}の色が{len(colors)}色あるので、パレットPNGは使いません')
+            self.palette = None
+
+    @staticmethod
+    def make_tile(background: np.ndarray, disc_color: Union[Tuple[int, int, int], None], marker_color: Union[Tuple[int, int, int], None]) -> np.ndarray:
+        tile = background.copy()
+        center = (DISC_RADIUS, DISC_RADIUS)
+        if disc_color is not None:
+            cv2.circle(tile, center, DISC_RADIUS, disc_color, thickness=-1)
+        if marker_color is not None:
+            cv2.circle(tile, center, MARKER_RADIUS, marker_color, thickness=-1)
+        return tile
+
+    # (B, G, R)を上位LUT_BITSビットずつにした色から、一番近いパレットの番号を引く表を作る
+    def make_lut(self) -> np.ndarray:
+        levels = (np.arange(2 ** LUT_BITS) << (8 - LUT_BITS)) + (1 << (7 - LUT_BITS))
+        colors = np.stack(np.meshgrid(levels, levels, levels, indexing='ij'), axis=-1).reshape(-1, 1, 3)
+        palette = self.palette.astype(np.int32)
+        lut = np.empty(len(colors), dtype=np.uint8)
+        step = 4096 # 一度に計算する色の数(メモリを使いすぎないように)
+        for i in range(0, len(colors), step):
+            lut[i : i + step] = ((colors[i : i + step] - palette) ** 2).sum(axis=-1).argmin(axis=1)
+        return lut.reshape(2 ** LUT_BITS, 2 ** LUT_BITS, 2 ** LUT_BITS)
+
+    # マス(x, y)にstateのタイルを貼り付ける
+    def put_tile(self, x: int, y: int, state: Tuple[int, bool], indexed: bool) -> None:
+        top = y * CELL_SIZE + CELL_SIZE // 2 - DISC_RADIUS
+        left = x * CELL_SIZE + CELL_SIZE // 2 - DISC_RADIUS
+        self.buffer[top : top + TILE_SIZE, left : left + TILE_SIZE] = self.tiles[state]
+        if indexed:
+            self.index_buffer[top : top + TILE_SIZE, left : left + TILE_SIZE] = self.index_tiles[state]
+
+    def compose(self, board: Board, last_move: Union[Tuple[int, int], None], show_moves: bool, indexed: bool) -> None:
+        np.copyto(self.buffer, self.template)
+        if indexed:
+            np.copyto(self.index_buffer, self.index_template)
+        black, white = board.to_bits()
+        for color, bits in ((BLACK, black), (WHITE, white)):
+            while bits:
+                sq = (bits & -bits).bit_length() - 1
+                bits &= bits - 1
+                x, y = sq % BOARD_SIZE + 1, sq // BOARD_SIZE + 1
+                self.put_tile(x, y, (color, (x, y) == last_move), indexed)
+        if show_moves and not board.is_end():
+            for x, y in board.legal_moves():
+                self.put_tile(x, y, (EMPTY, True), indexed)
+
+    # 盤面の画像を作って返す(返した配列は次に描いたときに上書きされるので、lockを取って使う)
+    # last_moveを指定するとそのマスに印を付け、show_movesなら手番側の合法手に印を付ける
+    def render(self, board: Board, last_move: Union[Tuple[int, int], None] = None, show_moves: bool = False) -> np.ndarray:
+        self.compose(board, last_move, show_moves, False)
+        return self.buffer
+
+    # 盤面の画像をformatの形式のバイト列にする。previewなら縮小する
+    def encode(self, board: Board, last_move: Union[Tuple[int, int], None] = None, show_moves: bool = False, format: str = IMAGE_FORMAT, preview: bool = False) -> bytes:
+        if format not in IMAGE_FORMATS:
+            raise ValueError(f'unknown image format: {format}')
+        with self.lock:
+            indexed = format == 'png' and not preview and self.palette is not None
+            self.compose(board, last_move, show_moves, indexed)
+            if indexed:
+                return encode_palette_png(self.index_buffer, self.palette)
+            img = self.buffer
+            if preview:
+                img = cv2.resize(img, (IMAGE_PREVIEW_SIZE, IMAGE_PREVIEW_SIZE), interpolation=cv2.INTER_AREA)
+                if format == 'png' and self.palette is not None:
+                    img = img >> (8 - LUT_BITS)
+                    return encode_palette_png(self.lut[img[..., 0], img[..., 1], img[..., 2]], self.palette)
+            if format == 'webp':
+                ok, encoded = cv2.imencode('.webp', img, [cv2.IMWRITE_WEBP_QUALITY, WEBP_LOSSLESS])
+            else:
+                ok, encoded = cv2.imencode('.png', img, [cv2.IMWRITE_PNG_COMPRESSION, IMAGE_PNG_COMPRESSION])
+        if not ok:
+            raise RuntimeError(f'failed to encode image as {format}')
+        return encoded.tobytes()
+
+    def write(self, path: str, board: Board, last_move: Union[Tuple[int, int], None] = None, show_moves: bool = False, format: str = IMAGE_FORMAT, preview: bool = False) -> None:
+        data = self.encode(board, last_move, show_moves, format, preview)
+        with open(path, 'wb') as f:
+            f.write(data)
+
+
+renderers: Dict[str, BoardRenderer] = {}
+
+
+# テンプレートごとに1つだけ作って使い回す
+def get_renderer(template_path: str = IMAGE_DIR + 'board_template.png') -> BoardRenderer:
+    if template_path not in renderers:
+        renderers[template_path] = BoardRenderer(template_path)
+    return renderers[template_path]
@@ -0,0 +1,69 @@
+# AIが1手を決めるまでに行った探索の統計
+# act_alpha_betaが1手ごとに作って返し、ログにも1行のJSONとして書く(sum_num.pyで集計できる)
+
+from typing import Dict, List, Union
+import json
+import logging
+
+import numpy as np
+
+
+STATS_LOG_PREFIX = '探索の統計：' # ログからこの後ろのJSONを読み出す
+
+
+class SearchStats:
+    def __init__(self) -> None:
+        self.move = None # 打った手の座標
+        self.score = 0 # 最善手の評価値
+        self.pv = [] # 読み筋
+        self.moves = 0 # ルートで打てる手の数
+        self.empties = 0 # 空きマスの数
+        self.depth = 0 # 最後まで探索できた深さ
+        self.nodes = 0 # 探索した局面の数(終盤の読み切りを含む)
+        self.leaves = 0 # 評価関数を呼んだ、または終局した末端の局面の数
+        self.elapsed = 0.0 # 探索にかかった時間(秒)
+        self.cutoffs = 0 # βカットの回数
+        self.first_move_cutoff_rate = 0.0 # βカットのうち1手目で起きた割合
+        self.tt_probes = 0 # 置換表を引いた回数
+        self.tt_hits = 0 # 置換表に局面があった回数
+        self.book = False # 定石の本の手を打ったか
+        self.cache = False # 解析キャッシュの手を打ったか
+        self.endgame = None # 終盤の読み切りの結果('wld' / 'exact')。読み切れなかったらNone
+        self.endgame_nodes = 0 # 終盤の読み切りで探索した局面の数
+        self.evaluator = '' # 使った評価関数の名前
+        self.workers = 1 # ルートを並列に探索したプロセス数
+        self.pondered = False # 相手の手番の間に先読みしておいた結果を使ったか
+
+    # 1秒あたりの探索局面数
+    @property
+    def nps(self) -> float:
+        return self.nodes / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def tt_hit_rate(self) -> float:
+        return self.tt_hits / self.tt_probes if self.tt_probes > 0 else 0.0
+
+    def to_dict(self) -> Dict[str, Union[int, float, str, bool, list, None]]:
+        # numpyの数(np.int64など)はJSONにできないので、Pythonのint・floatにしておく
+        record = {name: value.item() if isinstance(value, np.generic) else value for name, value in vars(self).items()}
+        record['move'] = [int(v) for v in self.move] if self.move is not None else None
+        record['pv'] = [[int(v) for v in move] if move is not None else None for move in self.pv]
+        record['elapsed'] = round(self.elapsed, 4)
+        record['first_move_cutoff_rate'] = round(self.first_move_cutoff_rate, 4)
+        record['nps'] = round(self.nps, 1)
+        record['tt_hit_rate'] = round(self.tt_hit_rate, 4)
+        return record
+
+    def log(self) -> None:
+        logging.info(STATS_LOG_PREFIX + json.dumps(self.to_dict(), ensure_ascii=False))
+
+
+# ログファイルから統計の記録を順に読み出す
+def read_stats_log(path: str) -> List[Dict]:
+    records = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            pos = line.find(STATS_LOG_PREFIX)
+            if pos >= 0:
+                records.append(json.loads(line[pos + len(STATS_LOG_PREFIX):]))
+    return records
@@ -1,791 +1,22 @@
-a = [
-	12,
-	14,
-	9,
-	12,
-	13,
-	12,
-	12,
-	13,
-	13,
-	12,
-	13,
-	13,
-	7,
-	9,
-	13,
-	11,
-	11,
-	11,
-	12,
-	12,
-	13,
-	10,
-	13,
-	12,
-	12,
-	10,
-	10,
-	10,
-	9,
-	9,
-	10,
-	10,
-	11,
-	9,
-	10,
-	12,
-	11,
-	13,
-	12,
-	12,
-	12,
-	11,
-	13,
-	13,
-	9,
-	13,
-	13,
-	14,
-	14,
-	11,
-	15,
-	12,
-	12,
-	12,
-	11,
-	10,
-	10,
-	13,
-	10,
-	11,
-	12,
-	11,
-	11,
-	10,
-	10,
-	10,
-	12,
-	15,
-	12,
-	10,
-	9,
-	10,
-	12,
-	11,
-	12,
-	12,
-	12,
-	12,
-	13,
-	11,
-	13,
-	12,
-	13,
-	11,
-	12,
-	11,
-	11,
-	11,
-	11,
-	10,
-	11,
-	11,
-	10,
-	10,
-	11,
-	14,
-	11,
-	11,
-	13,
-	13,
-	11,
-	9,
-	13,
-	13,
-	13,
-	15,
-	11,
-	15,
-	12,
-	13,
-	12,
-	11,
-	10,
-	10,
-	14,
-	10,
-	13,
-	12,
-	13,
-	12,
-	11,
-	14,
-	13,
-	13,
-	15,
-	14,
-	8,
-	11,
-	13,
-	13,
-	9,
-	11,
-	13,
-	11,
-	9,
-	14,
-	10,
-	12,
-	11,
-	12,
-	10,
-	11,
-	9,
-	11,
-	10,
-	15,
-	14,
-	13,
-	15,
-	10,
-	14,
-	13,
-	12,
-	15,
-	9,
-	11,
-	12,
-	10,
-	13,
-	12,
-	8,
-	13,
-	13,
-	13,
-	12,
-	14,
-	13,
-	13,
-	11,
-	10,
-	10,
-	14,
-	12,
-	12,
-	9,
-	11,
-	12,
-	12,
-	13,
-	13,
-	9,
-	12,
-	12,
-	11,
-	11,
-	13,
-	12,
-	12,
-	13,
-	13,
-	9,
-	10,
-	11,
-	11,
-	12,
-	11,
-	12,
-	11,
-	10,
-	12,
-	11,
-	10,
-	11,
-	10,
-	10,
-	9,
-	10,
-	10,
-	12,
-	10,
-	10,
-	9,
-	11,
-	14,
-	11,
-	13,
-	14,
-	14,
-	11,
-	11,
-	11,
-	12,
-	14,
-	13,
-	14,
-	13,
-	12,
-	13,
-	14,
-	14,
-	14,
-	13,
-	16,
-	11,
-	9,
-	11,
-	14,
-	12,
-	12,
-	12,
-	12,
-	10,
-	10,
-	10,
-	14,
-	9,
-	13,
-	14,
-	11,
-	14,
-	14,
-	14,
-	14,
-	16,
-	14,
-	9,
-	10,
-	12,
-	13,
-	11,
-	13,
-	13,
-	13,
-	15,
-	10,
-	13,
-	14,
-	14,
-	13,
-	12,
-	14,
-	15,
-	16,
-	15,
-	16,
-	11,
-	13,
-	12,
-	12,
-	10,
-	13,
-	14,
-	13,
-	12,
-	14,
-	14,
-	15,
-	15,
-	13,
-	15,
-	10,
-	14,
-	11,
-	11,
-	12,
-	13,
-	8,
-	13,
-	12,
-	13,
-	14,
-	11,
-	14,
-	12,
-	11,
-	12,
-	10,
-	10,
-	12,
-	9,
-	13,
-	11,
-	13,
-	13,
-	13,
-	14,
-	9,
-	15,
-	14,
-	7,
-	11,
-	12,
-	13,
-	8,
-	10,
-	12,
-	9,
-	13,
-	11,
-	9,
-	10,
-	10,
-	10,
-	12,
-	11,
-	10,
-	10,
-	11,
-	11,
-	10,
-	8,
-	14,
-	14,
-	15,
-	12,
-	12,
-	12,
-	11,
-	11,
-	11,
-	8,
-	12,
-	12,
-	10,
-	14,
-	14,
-	14,
-	10,
-	12,
-	12,
-	12,
-	11,
-	11,
-	10,
-	12,
-	12,
-	14,
-	10,
-	12,
-	12,
-	12,
-	11,
-	12,
-	13,
-	12,
-	12,
-	14,
-	13,
-	8,
-	11,
-	12,
-	12,
-	9,
-	11,
-	13,
-	11,
-	10,
-	14,
-	10,
-	12,
-	11,
-	12,
-	11,
-	13,
-	11,
-	9,
-	11,
-	11,
-	10,
-	12,
-	10,
-	10,
-	10,
-	10,
-	11,
-	12,
-	10,
-	15,
-	14,
-	11,
-	15,
-	14,
-	13,
-	16,
-	8,
-	12,
-	13,
-	10,
-	13,
-	13,
-	13,
-	8,
-	13,
-	13,
-	12,
-	15,
-	14,
-	14,
-	14,
-	11,
-	11,
-	14,
-	13,
-	13,
-	11,
-	13,
-	13,
-	14,
-	10,
-	13,
-	13,
-	10,
-	13,
-	14,
-	14,
-	12,
-	11,
-	14,
-	14,
-	9,
-	10,
-	13,
-	11,
-	12,
-	13,
-	14,
-	12,
-	13,
-	12,
-	12,
-	11,
-	11,
-	12,
-	12,
-	11,
-	12,
-	11,
-	10,
-	13,
-	11,
-	10,
-	11,
-	11,
-	10,
-	11,
-	13,
-	10,
-	13,
-	11,
-	13,
-	14,
-	10,
-	10,
-	10,
-	12,
-	12,
-	14,
-	13,
-	12,
-	13,
-	13,
-	14,
-	13,
-	12,
-	14,
-	14,
-	14,
-	14,
-	16,
-	11,
-	10,
-	11,
-	14,
-	12,
-	12,
-	12,
-	12,
-	11,
-	14,
-	13,
-	14,
-	12,
-	12,
-	12,
-	12,
-	11,
-	13,
-	12,
-	13,
-	8,
-	11,
-	13,
-	14,
-	13,
-	11,
-	12,
-	11,
-	12,
-	10,
-	13,
-	11,
-	11,
-	13,
-	13,
-	12,
-	12,
-	10,
-	13,
-	12,
-	11,
-	10,
-	10,
-	8,
-	11,
-	10,
-	11,
-	9,
-	10,
-	10,
-	11,
-	10,
-	15,
-	12,
-	11,
-	11,
-	14,
-	14,
-	14,
-	15,
-	12,
-	15,
-	10,
-	14,
-	11,
-	13,
-	13,
-	17,
-	11,
-	18,
-	13,
-	12,
-	12,
-	16,
-	13,
-	12,
-	12,
-	14,
-	12,
-	12,
-	11,
-	15,
-	10,
-	13,
-	13,
-	12,
-	15,
-	13,
-	14,
-	14,
-	14,
-	14,
-	13,
-	9,
-	11,
-	11,
-	13,
-	12,
-	10,
-	12,
-	14,
-	13,
-	13,
-	12,
-	15,
-	11,
-	13,
-	13,
-	13,
-	15,
-	12,
-	14,
-	11,
-	11,
-	10,
-	11,
-	12,
-	13,
-	11,
-	12,
-	11,
-	13,
-	11,
-	10,
-	11,
-	14,
-	13,
-	15,
-	13,
-	14,
-	12,
-	11,
-	13,
-	11,
-	14,
-	15,
-	12,
-	14,
-	14,
-	15,
-	13,
-	14,
-	13,
-	15,
-	14,
-	10,
-	16,
-	14,
-	14,
-	14,
-	12,
-	12,
-	10,
-	10,
-	11,
-	14,
-	14,
-	14,
-	13,
-	9,
-	12,
-	11,
-	14,
-	14,
-	13,
-	13,
-	13,
-	13,
-	13,
-	10,
-	12,
-	13,
-	14,
-	11,
-	13,
-	14,
-	10,
-	11,
-	13,
-	12,
-	11,
-	13,
-	11,
-	12,
-	11,
-	14,
-	13,
-	12,
-	12,
-	13,
-	12,
-	13,
-	11,
-	13,
-	12,
-	12,
-	13,
-	15,
-	12,
-	12,
-	14,
-	10,
-	16,
-	16,
-	12,
-	15,
-	15,
-	14,
-	9,
-	16,
-	13,
-	14,
-	14,
-	14,
-	14,
-	14,
-	11,
-	12,
-	12,
-	14,
-	12,
-	13,
-	13,
-	14,
-	15,
-	10,
-	13,
-	13,
-	14,
-	14,
-	13,
-	14,
-	13,
-	14,
-	14,
-	13,
-	9,
-	11,
-	11,
-	12,
-	14,
-	14,
-	12,
-	13,
-	13,
-	15,
-	10,
-	11,
-	11,
-	12,
-	13,
-	12,
-	11,
-	11,
-	12,
-	11,
-	10,
-	12,
-	14,
-	13,
-	13,
-	11,
-	11,
-	14,
-	14,
-	13,
-	11,
-	15,
-	14,
-	12,
-	14,
-	14,
-	14,
-	13,
-	14,
-	14,
-	14,
-	12,
-	14,
-	10,
-	16,
-	12,
-	12,
-	13,
-	12,
-	12,
-	12,
-	12,
-	11
-]
-print(sum(a))
\ No newline at end of file
+# ログに書かれた探索の統計を集計する
+# 使い方: python sum_num.py [ログファイル]
+
+import sys
+
+from search_stats import read_stats_log
+
+
+path = sys.argv[1] if len(sys.argv) > 1 else '/var/log/intern3/flask.log'
+records = read_stats_log(path)
+searched = [r for r in records if not r['book'] and not r.get('cache')]
+print(f'手数：{len(records)}　定石の本：{sum(1 for r in records if r["book"])}　解析キャッシュ：{sum(1 for r in records if r.get("cache"))}　終盤の読み切り：{sum(1 for r in records if r["endgame"])}')
+if searched:
+    nodes = sum(r['nodes'] for r in searched)
+    elapsed = sum(r['elapsed'] for r in searched)
+    times = sorted(r['elapsed'] for r in searched)
+    print(f'探索する数の合計：{sum(r["moves"] for r in searched)}')
+    print(f'ノード数の合計：{nodes}　末端の局面数の合計：{sum(r["leaves"] for r in searched)}')
+    print(f'平均の深さ：{sum(r["depth"] for r in searched) / len(searched):.2f}')
+    print(f'探索時間の合計：{elapsed:.3f}秒　最大：{times[-1]:.3f}秒　NPS：{nodes / elapsed if elapsed > 0 else 0:.0f}')
+    probes = sum(r['tt_probes'] for r in searched)
+    print(f'置換表のヒット率：{sum(r["tt_hits"] for r in searched) / probes if probes > 0 else 0:.3f}　βカット：{sum(r["cutoffs"] for r in searched)}回')
@@ -0,0 +1,74 @@
+# 盤面の対称性(回転・反転の8通り)
+# 対称な局面を同じキーにまとめるために、8通りのうちビット列が最小になる向きを標準形とする
+# 変換の番号tは 4: 対角線(a1-h8)で反転 → 2: 上下反転 → 1: 左右反転 の順に、立っているビットの変換を行う
+
+from typing import Tuple
+
+from constant import BOARD_SIZE
+
+
+FULL_MASK = 0xFFFFFFFFFFFFFFFF
+TRANSFORM_NUM = 8
+
+# バイト(1行分)の中でビットの並びを逆にする表
+_REVERSE_BYTE = bytes(int(f'{i:08b}'[::-1], 2) for i in range(256))
+
+
+def flip_vertical(bits: int) -> int:
+    return int.from_bytes(bits.to_bytes(8, 'little'), 'big')
+
+
+def flip_horizontal(bits: int) -> int:
+    return int.from_bytes(bits.to_bytes(8, 'little').translate(_REVERSE_BYTE), 'little')
+
+
+def flip_diagonal(bits: int) -> int:
+    # a1-h8の対角線で反転する(x, y) -> (y, x)
+    t = 0x0F0F0F0F00000000 & (bits ^ (bits << 28))
+    bits ^= t ^ (t >> 28)
+    t = 0x3333000033330000 & (bits ^ (bits << 14))
+    bits ^= t ^ (t >> 14)
+    t = 0x5500550055005500 & (bits ^ (bits << 7))
+    bits ^= t ^ (t >> 7)
+    return bits & FULL_MASK
+
+
+def transform(bits: int, t: int) -> int:
+    if t & 4:
+        bits = flip_diagonal(bits)
+    if t & 2:
+        bits = flip_vertical(bits)
+    if t & 1:
+        bits = flip_horizontal(bits)
+    return bits
+
+
+def inverse_transform(bits: int, t: int) -> int:
+    if t & 1:
+        bits = flip_horizontal(bits)
+    if t & 2:
+        bits = flip_vertical(bits)
+    if t & 4:
+        bits = flip_diagonal(bits)
+    return bits
+
+
+# マス番号の変換表 SQUARE_MAP[t][sq], INVERSE_SQUARE_MAP[t][sq]
+SQUARE_MAP = [[transform(1 << sq, t).bit_length() - 1 for sq in range(BOARD_SIZE * BOARD_SIZE)] for t in range(TRANSFORM_NUM)]
+INVERSE_SQUARE_MAP = [[inverse_transform(1 << sq, t).bit_length() - 1 for sq in range(BOARD_SIZE * BOARD_SIZE)] for t in range(TRANSFORM_NUM)]
+
+
+# 2つのビット列(黒と白、または手番側と相手側)に同じ変換をかけて、最小になるものを返す
+# 戻り値は(変換後の1つ目, 変換後の2つ目, 変換の番号)
+# 標準形のマス番号sqを元の向きに戻すには INVERSE_SQUARE_MAP[t][sq] を使う
+def canonicalize(first: int, second: int) -> Tuple[int, int, int]:
+    first_d = flip_diagonal(first)
+    second_d = flip_diagonal(second)
+    best = (first, second, 0)
+    for base, (f, s) in ((0, (first, second)), (4, (first_d, second_d))):
+        fv = flip_vertical(f)
+        sv = flip_vertical(s)
+        for t, candidate in ((base, (f, s)), (base | 2, (fv, sv)), (base | 1, (flip_horizontal(f), flip_horizontal(s))), (base | 3, (flip_horizontal(fv), flip_horizontal(sv)))):
+            if candidate < best[:2]:
+                best = candidate + (t,)
+    return best
@@ -0,0 +1,47 @@
+# alpha_beta.pyのテスト
+# 使い方: python -m pytest test_alpha_beta.py
+
+import json
+import random
+
+from alpha_beta import Search, act_alpha_beta, search_root_parallel
+from bitboard import BitBoard
+from constant import BLACK
+from move_ordering import MoveOrdering
+
+
+# 初期局面(黒の手番)からランダムにmoves手打った局面
+def random_board(seed: int, moves: int) -> BitBoard:
+    rng = random.Random(seed)
+    board = BitBoard(0, BLACK, BitBoard().to_bytes())
+    for _ in range(moves):
+        legal_moves = board.legal_moves()
+        if not legal_moves:
+            break
+        board.make_move(*rng.choice(legal_moves))
+    return board
+
+
+# 並列の探索は同じ深さの直列の探索と同じ手・同じ評価値になる
+def test_parallel_matches_serial() -> None:
+    for seed in range(4):
+        board = random_board(seed, 16)
+        for ordering in (None, MoveOrdering()):
+            serial_score, serial_pv = Search(None, ordering).search(board, 4)
+            parallel_score, parallel_pv, _, _ = search_root_parallel(board, 4, 2, ordering=ordering)
+            assert (parallel_score, parallel_pv[0]) == (serial_score, serial_pv[0])
+
+
+def test_act_alpha_beta_parallel_matches_serial() -> None:
+    for seed in range(4):
+        serial = act_alpha_beta(random_board(seed, 20), None, tt=None, ordering=MoveOrdering(), endgame_empties=0, workers=1, book=None, log=False, cache=None)
+        parallel = act_alpha_beta(random_board(seed, 20), None, ordering=MoveOrdering(), endgame_empties=0, workers=2, book=None, log=False, cache=None)
+        assert (parallel.move, parallel.score, parallel.depth) == (serial.move, serial.score, serial.depth)
+
+
+# 深さ固定(時間の指定なし)で探索した統計をログに書ける
+def test_fixed_depth_stats_log() -> None:
+    stats = act_alpha_beta(random_board(0, 10), None, book=None, log=False, cache=None)
+    assert type(stats.depth) is int
+    stats.log()
+    assert json.loads(json.dumps(stats.to_dict()))['depth'] == stats.depth
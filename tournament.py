@@ -0,0 +1,201 @@
+# AI同士の対戦(自己対戦)で強さと速さを比べる
+# 2つの設定(エンジン)で同じ開始局面を先手・後手を入れ替えて2局ずつ打ち、勝率(信頼区間つき)と1手あたりの時間・局面数を集計する
+# 速くした設定が弱くなっていないことを確かめるのに使う
+#
+# 使い方: python tournament.py --a 'alpha_beta:time=0.5' --b 'alpha_beta:time=0.5,evaluator=pattern' --games 100 --processes 4
+#
+# エンジンの書き方
+#   greedy                             : Board.put_max_pos(一番多く裏返せる手)
+#   alpha_beta:time=秒,depth=深さ,...  : act_alpha_beta。設定はカンマ区切りで、書かなければ既定値
+#       time      1手の探索時間(秒)。書かずにdepthだけ書くとその深さまで必ず読む
+#       depth     反復深化の最大の深さ
+#       endgame   終盤の読み切りを始める空きマスの数
+#       evaluator 評価関数の名前(positional / pattern)
+#       tt        1なら置換表を使う
+#       ordering  1なら手の並べ替えを使う
+#       book      1なら定石の本を使う
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Tuple
+import argparse
+import json
+import math
+import random
+import time
+
+from alpha_beta import act_alpha_beta
+from bitboard import BitBoard
+from board import bits2array
+from constant import WHITE, BLACK, SEARCH_TIME_LIMIT, MAX_SEARCH_DEPTH, ENDGAME_EMPTIES
+from evaluation import get_evaluator
+from move_ordering import MoveOrdering
+from opening_book import load_opening_book
+from transposition import TranspositionTable
+
+
+Z_95 = 1.959964 # 95%信頼区間の正規分布の値
+
+
+# 'alpha_beta:time=0.5,tt=0'を('alpha_beta', {'time': '0.5', 'tt': '0'})にする
+def parse_engine(spec: str) -> Tuple[str, Dict[str, str]]:
+    kind, _, options = spec.partition(':')
+    if kind not in ('greedy', 'alpha_beta'):
+        raise ValueError(f'unknown engine: {spec}')
+    settings = dict(option.split('=') for option in options.split(',') if option)
+    return kind, settings
+
+
+class Player:
+    def __init__(self, spec: str) -> None:
+        self.kind, settings = parse_engine(spec)
+        if 'time' in settings:
+            self.time_limit = float(settings['time'])
+        elif 'depth' in settings:
+            self.time_limit = math.inf # 深さだけ指定したときは時間で打ち切らない
+        else:
+            self.time_limit = SEARCH_TIME_LIMIT
+        self.max_depth = int(settings.get('depth', MAX_SEARCH_DEPTH))
+        self.endgame_empties = int(settings.get('endgame', ENDGAME_EMPTIES))
+        self.evaluator = get_evaluator(settings.get('evaluator', 'positional'))
+        # 対戦相手と置換表などを共有しないように、プレイヤーごとに持つ
+        self.tt = TranspositionTable() if settings.get('tt', '1') == '1' else None
+        self.ordering = MoveOrdering() if settings.get('ordering', '1') == '1' else None
+        self.book = load_opening_book() if settings.get('book', '0') == '1' else None
+
+    # 1手打って(時間, 探索した局面数)を返す
+    def play(self, board: BitBoard) -> Tuple[float, int]:
+        start = time.perf_counter()
+        if self.kind == 'greedy':
+            board.put_max_pos()
+            return time.perf_counter() - start, 1
+        stats = act_alpha_beta(board, self.time_limit, self.max_depth, self.tt, self.ordering, self.endgame_empties, 1, self.book, self.evaluator, log=False, cache=None)
+        return time.perf_counter() - start, stats.nodes
+
+
+# 初期局面からランダムにrandom_moves手打った局面(黒, 白, 手番)を作る
+def random_opening(rng: random.Random, random_moves: int) -> Tuple[int, int, int]:
+    board = BitBoard()
+    board.current_color = BLACK
+    board.init_movable()
+    for _ in range(random_moves):
+        if board.is_end():
+            break
+        board.put_disc(*rng.choice(board.legal_moves()))
+    return board.black, board.white, board.current_color
+
+
+# 定石の本に載っている局面から選ぶ(本は手番側と相手側で持っているので、手番側を黒にする)
+def book_openings(rng: random.Random, num: int) -> List[Tuple[int, int, int]]:
+    book = load_opening_book()
+    if book is None or len(book) == 0:
+        raise ValueError('opening book not found')
+    openings = []
+    for i in rng.sample(range(len(book)), min(num, len(book))):
+        player, opponent, _, _, _ = book.record(i)
+        openings.append((player, opponent, BLACK))
+    return openings
+
+
+# 1局打つ。jobは(局の番号, 開始局面, Aのエンジン, Bのエンジン, Aの色)
+def play_game(job: tuple) -> Dict:
+    game_id, (black, white, color), spec_a, spec_b, color_a = job
+    players = {color_a: Player(spec_a), -color_a: Player(spec_b)}
+    board = BitBoard(black.bit_count() + white.bit_count() - 4, color, bits2array(black, white).tobytes())
+    times = {'a': [], 'b': []}
+    nodes = {'a': [], 'b': []}
+    while not board.is_end():
+        side = 'a' if board.current_color == color_a else 'b'
+        elapsed, node_num = players[board.current_color].play(board)
+        times[side].append(elapsed)
+        nodes[side].append(node_num)
+    diff = board.black.bit_count() - board.white.bit_count()
+    if color_a == WHITE:
+        diff = -diff
+    return {'game': game_id, 'a_color': 'white' if color_a == WHITE else 'black', 'disc_diff': diff, 'times': times, 'nodes': nodes}
+
+
+# 勝率のWilsonスコア信頼区間(引き分けは0.5勝として数える)
+def wilson_interval(score: float, games: int, z: float = Z_95) -> Tuple[float, float]:
+    if games == 0:
+        return 0.0, 1.0
+    p = score / games
+    center = (p + z * z / (2 * games)) / (1 + z * z / games)
+    margin = z * math.sqrt(p * (1 - p) / games + z * z / (4 * games * games)) / (1 + z * z / games)
+    return max(0.0, center - margin), min(1.0, center + margin)
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(math.ceil(q * len(values))) - 1)]
+
+
+def summarize(results: List[Dict], spec_a: str, spec_b: str) -> Dict:
+    wins = sum(1 for r in results if r['disc_diff'] > 0)
+    draws = sum(1 for r in results if r['disc_diff'] == 0)
+    losses = len(results) - wins - draws
+    score = wins + draws / 2
+    low, high = wilson_interval(score, len(results))
+    summary = {
+        'a': spec_a, 'b': spec_b, 'games': len(results), 'a_wins': wins, 'draws': draws, 'a_losses': losses,
+        'a_score_rate': score / len(results) if results else 0.0, 'a_score_rate_95ci': [low, high],
+        'average_disc_diff': sum(r['disc_diff'] for r in results) / len(results) if results else 0.0,
+    }
+    for side in ('a', 'b'):
+        times = [t for r in results for t in r['times'][side]]
+        nodes = [n for r in results for n in r['nodes'][side]]
+        summary[side + '_moves'] = len(times)
+        summary[side + '_average_move_time'] = sum(times) / len(times) if times else 0.0
+        summary[side + '_p99_move_time'] = percentile(times, 0.99)
+        summary[side + '_max_move_time'] = max(times) if times else 0.0
+        summary[side + '_nodes_per_move'] = sum(nodes) / len(nodes) if nodes else 0.0
+    return summary
+
+
+def run_tournament(spec_a: str, spec_b: str, games: int, processes: int = 1, random_moves: int = 6, opening: str = 'random', seed: int = 0) -> Tuple[Dict, List[Dict]]:
+    parse_engine(spec_a)
+    parse_engine(spec_b)
+    rng = random.Random(seed)
+    pairs = (games + 1) // 2
+    if opening == 'book':
+        openings = book_openings(rng, pairs)
+    else:
+        openings = [random_opening(rng, random_moves) for _ in range(pairs)]
+    # 同じ開始局面で先手・後手を入れ替えて打つ
+    jobs = []
+    for start in openings:
+        for color_a in (BLACK, WHITE):
+            if len(jobs) < games:
+                jobs.append((len(jobs), start, spec_a, spec_b, color_a))
+    if processes > 1:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            results = list(executor.map(play_game, jobs))
+    else:
+        results = [play_game(job) for job in jobs]
+    return summarize(results, spec_a, spec_b), results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='AI同士を対戦させて強さと速さを比べる')
+    parser.add_argument('--a', default='alpha_beta', help='エンジンA')
+    parser.add_argument('--b', default='greedy', help='エンジンB')
+    parser.add_argument('--games', type=int, default=20, help='対局数(開始局面ごとに先手・後手を入れ替えた2局ずつ)')
+    parser.add_argument('--processes', type=int, default=1, help='並列に対局するプロセス数')
+    parser.add_argument('--opening', choices=['random', 'book'], default='random', help='開始局面の選び方')
+    parser.add_argument('--random-moves', type=int, default=6, help='randomのときに初期局面からランダムに打つ手数')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='tournament.json', help='結果を書き込むJSONファイル')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    summary, results = run_tournament(args.a, args.b, args.games, args.processes, args.random_moves, args.opening, args.seed)
+    summary['elapsed'] = time.perf_counter() - start
+    with open(args.output, 'w') as f:
+        json.dump({'summary': summary, 'games': results}, f, ensure_ascii=False, indent=1)
+    low, high = summary['a_score_rate_95ci']
+    print(f'A: {args.a}\nB: {args.b}')
+    print(f'{summary["games"]}局　Aの{summary["a_wins"]}勝{summary["a_losses"]}敗{summary["draws"]}分　勝率{summary["a_score_rate"]:.3f} (95%信頼区間 {low:.3f} - {high:.3f})　平均石差{summary["average_disc_diff"]:+.1f}')
+    for side in ('a', 'b'):
+        print(f'{side.upper()}: 平均{summary[side + "_average_move_time"]:.3f}秒/手　p99 {summary[side + "_p99_move_time"]:.3f}秒　最大{summary[side + "_max_move_time"]:.3f}秒　{summary[side + "_nodes_per_move"]:.0f}局面/手')
+    print(f'結果を{args.output}に書き込みました({summary["elapsed"]:.1f}秒)')
@@ -0,0 +1,194 @@
+# 置換表(トランスポジションテーブル)
+# 探索済みの局面の評価値と最善手を覚えておき、手順違いで同じ局面に来たときに再探索を省く
+# 局面はZobristハッシュ(マスごとの乱数のXOR)で64bitのキーにする
+
+from multiprocessing import resource_tracker, shared_memory
+from typing import Tuple, Union
+import os
+import random
+
+import numpy as np
+
+from constant import BOARD_SIZE, WHITE, TT_SIZE, TT_SHM_NAME, TT_SHM_ENV
+
+
+# 評価値の種類
+EXACT = 0 # 正確な値
+LOWER_BOUND = 1 # 真の値はこれ以上(βカット)
+UPPER_BOUND = 2 # 真の値はこれ以下(αを超えなかった)
+
+NO_MOVE = BOARD_SIZE * BOARD_SIZE # 最善手がないことを表すマス番号
+
+# プロセスが変わっても同じキーになるようにシードを固定する
+_rand = random.Random(20220801)
+ZOBRIST_BLACK = [_rand.getrandbits(64) for _ in range(BOARD_SIZE * BOARD_SIZE)]
+ZOBRIST_WHITE = [_rand.getrandbits(64) for _ in range(BOARD_SIZE * BOARD_SIZE)]
+ZOBRIST_SIDE = _rand.getrandbits(64) # 白の手番のときにXORする
+
+
+def _byte_table(keys: list) -> list:
+    # 8マス分(1バイト)の石の並び256通りについて、あらかじめXORをとっておく
+    table = []
+    for i in range(BOARD_SIZE):
+        row = []
+        for b in range(256):
+            h = 0
+            for k in range(8):
+                if b >> k & 1:
+                    h ^= keys[i * 8 + k]
+            row.append(h)
+        table.append(row)
+    return table
+
+
+_BLACK_TABLE = _byte_table(ZOBRIST_BLACK)
+_WHITE_TABLE = _byte_table(ZOBRIST_WHITE)
+
+
+def zobrist_hash(black: int, white: int, color: int) -> int:
+    # マスごとのXORと同じ値を、1バイトずつ表を引いて求める
+    h = ZOBRIST_SIDE if color == WHITE else 0
+    for i in range(BOARD_SIZE):
+        h ^= _BLACK_TABLE[i][black >> (i * 8) & 0xFF] ^ _WHITE_TABLE[i][white >> (i * 8) & 0xFF]
+    return h
+
+
+class TranspositionTable:
+    # バケットごとに深さ優先で置き換えるスロット(0)と常に置き換えるスロット(1)を持つ
+    # データは1つの64bit整数に詰め、キーはデータとXORして格納する(書き込みの途中を読んでも検出できる)
+    # データのビット配置: 評価値(32bit, 2^31だけずらす) | 深さ(8bit) | 種類(2bit) | 最善手(7bit) | 世代(8bit)
+    # bufferを渡すと、キーとデータをその上に置く(共有メモリ用。大きさはbucket_num * 32バイト)
+    def __init__(self, size: int = TT_SIZE, buffer: Union[memoryview, None] = None) -> None:
+        self.init_entries(size, buffer)
+        self.generation = 0
+
+    # エントリの配列と統計を用意する(世代には触らない)
+    def init_entries(self, size: int, buffer: Union[memoryview, None]) -> None:
+        self.bucket_num = max(1, size // 2)
+        if buffer is None:
+            self.keys = np.zeros((self.bucket_num, 2), dtype=np.uint64)
+            self.data = np.zeros((self.bucket_num, 2), dtype=np.uint64)
+        else:
+            self.keys, self.data = np.ndarray((2, self.bucket_num, 2), dtype=np.uint64, buffer=buffer)
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+
+    # 次の探索を始めるときに呼ぶ(前回までのエントリは置き換えられやすくなる。統計は1回の探索ごとに数え直す)
+    def new_search(self) -> None:
+        self.generation = (self.generation + 1) & 0xFF
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+
+    def clear(self) -> None:
+        self.keys[:, :] = 0
+        self.data[:, :] = 0
+        self.generation = 0
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+
+    # (深さ, 種類, 評価値, 最善手)を返す。見つからなければNone
+    def probe(self, key: int) -> Union[Tuple[int, int, int, int], None]:
+        self.probes += 1
+        idx = key % self.bucket_num
+        for slot in range(2):
+            data = int(self.data[idx, slot])
+            if int(self.keys[idx, slot]) ^ data == key and data != 0:
+                self.hits += 1
+                return ((data >> 32) & 0xFF, (data >> 40) & 0x3, (data & 0xFFFFFFFF) - 2 ** 31, (data >> 42) & 0x7F)
+        return None
+
+    def store(self, key: int, depth: int, flag: int, score: int, move: int = NO_MOVE) -> None:
+        self.stores += 1
+        idx = key % self.bucket_num
+        data = (int(score) + 2 ** 31) | int(depth) << 32 | flag << 40 | int(move) << 42 | self.generation << 49
+        old = int(self.data[idx, 0])
+        old_depth = (old >> 32) & 0xFF
+        old_generation = (old >> 49) & 0xFF
+        # 深さ優先のスロットは、同じ局面か、より深い探索か、古い探索のエントリなら置き換える
+        if old == 0 or int(self.keys[idx, 0]) ^ old == key or int(depth) >= old_depth or old_generation != self.generation:
+            slot = 0
+        else:
+            slot = 1
+        self.keys[idx, slot] = key ^ data
+        self.data[idx, slot] = data
+
+    def hit_rate(self) -> float:
+        return self.hits / self.probes if self.probes > 0 else 0.0
+
+
+# このプロセスが使っているresource_trackerを表す値(同じトラッカーを使うプロセスは同じパイプにつながっているので、同じ値になる)
+def tracker_id() -> int:
+    return os.fstat(resource_tracker.getfd()).st_ino
+
+
+# 複数のプロセス(gunicornのワーカー)で共有する置換表
+# gunicornのマスターが起動時に作り(create)、各ワーカーは名前で開く(attach)。使い方は普通の置換表と同じ
+# ロックは使わない。キーをデータとXORして格納しているので、別のプロセスが書きかけのエントリは読んでもキーが合わず無視される
+# 共有メモリの先頭にバケット数と世代(と作ったプロセスのresource_tracker)を書いておき、開く側はバケット数を合わせ、世代は全プロセスで同じものを使う
+# (世代がプロセスごとだと、他のワーカーのエントリが全部古いものとして扱われ、深さ優先の置き換えが効かなくなる)
+class SharedTranspositionTable(TranspositionTable):
+    HEADER_SIZE = 24 # バケット数(8バイト) + 世代(8バイト) + 作ったプロセスのresource_tracker(8バイト)
+
+    def __init__(self, name: str = TT_SHM_NAME, size: int = TT_SIZE, create: bool = False) -> None:
+        bucket_num = max(1, size // 2)
+        if create:
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=self.HEADER_SIZE + bucket_num * 32)
+            self.header = np.ndarray((3,), dtype=np.uint64, buffer=self.shm.buf)
+            self.header[0] = bucket_num
+            self.header[2] = tracker_id()
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            self.header = np.ndarray((3,), dtype=np.uint64, buffer=self.shm.buf)
+            # 開いたときもresource_trackerに登録され、そのトラッカーはプロセスが終わると共有メモリを消してしまう
+            # forkしたワーカーはマスターのトラッカーを引き継いでいて、登録はマスターのものと1つにまとまるので、外すとマスターの登録が消える
+            # 別のトラッカーを使うプロセスのときだけ登録を外す(消すのは作ったマスターだけ)
+            if int(self.header[2]) != tracker_id():
+                resource_tracker.unregister(self.shm._name, 'shared_memory')
+            bucket_num = int(self.header[0])
+        self.buffer = self.shm.buf[self.HEADER_SIZE:self.HEADER_SIZE + bucket_num * 32]
+        # 開くときは、他のプロセスが使っている世代を書き換えないように、基底クラスの__init__(世代を0にする)を通さない
+        self.init_entries(bucket_num * 2, self.buffer)
+        if create:
+            self.generation = 0
+
+    @property
+    def generation(self) -> int:
+        return int(self.header[1])
+
+    @generation.setter
+    def generation(self, generation: int) -> None:
+        self.header[1] = generation
+
+    # 前回異常終了したときの共有メモリが残っていたら消してから作る
+    @classmethod
+    def create(cls, name: str = TT_SHM_NAME, size: int = TT_SIZE) -> 'SharedTranspositionTable':
+        try:
+            return cls(name, size, create=True)
+        except FileExistsError:
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+            return cls(name, size, create=True)
+
+    def close(self) -> None:
+        # 配列が共有メモリを参照している間は閉じられない
+        del self.keys, self.data, self.header
+        self.buffer.release()
+        self.shm.close()
+
+    def unlink(self) -> None:
+        self.shm.unlink()
+
+
+# 環境変数TT_SHM_ENVが'1'で共有の置換表があれば開き、それ以外はこのプロセスだけの置換表を作る
+# 環境変数を見るのは、tournament.pyやperft.pyなどの道具が本番の共有の置換表に書き込まないようにするため
+def load_transposition_table(name: str = TT_SHM_NAME) -> TranspositionTable:
+    if os.environ.get(TT_SHM_ENV) != '1':
+        return TranspositionTable()
+    try:
+        return SharedTranspositionTable(name)
+    except FileNotFoundError:
+        return TranspositionTable()